@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Dict
 from app.api.auth import get_current_user
-from app.models.schemas import User, MovementProposal
+from app.models.schemas import User, MovementProposal, PendingBatchRequest, PendingBatchResponse
 from app.services.sheets_service import sheet_service
+from app.services.auth_service import auth_service
 from app.models.schemas import ActionType, MaterialState # Helper imports if needed for reconstruction
 
 router = APIRouter()
@@ -31,12 +32,14 @@ async def approve_pending_action(action_id: str, current_user: User = Depends(ge
     if action["STATUS"] != "PENDING":
         raise HTTPException(status_code=400, detail="Action already processed")
 
-    # 2. Parse Payload
-    import json
-    try:
-        payload = json.loads(action["PAYLOAD_JSON"])
-    except Exception as e:
-         raise HTTPException(status_code=500, detail=f"Failed to parse action payload: {e}")
+    # 2. Parse Payload (already parsed by the pending-actions index)
+    payload = action.get("PAYLOAD")
+    if payload is None:
+        import json
+        try:
+            payload = json.loads(action["PAYLOAD_JSON"])
+        except Exception as e:
+             raise HTTPException(status_code=500, detail=f"Failed to parse action payload: {e}")
          
     # 3. Execute
     requester = action["REQUESTER_EMAIL"]
@@ -44,8 +47,8 @@ async def approve_pending_action(action_id: str, current_user: User = Depends(ge
     
     sheet_service.execute_transaction(action_type, payload, user_id=requester, transaction_id=f"TX-{action_id}")
     
-    # 4. Remove from Pending (or mark Approved if we kept history, but plan said remove)
-    sheet_service.delete_pending_action(action_id)
+    # 4. Mark as Approved (the row is archived by the scheduled pending compaction)
+    sheet_service.mark_pending_actions([action_id], "APPROVED")
     
     return {"status": "APPROVED", "action_id": action_id}
 
@@ -56,10 +59,110 @@ async def reject_pending_action(action_id: str, current_user: User = Depends(get
     action = sheet_service.get_pending_action(action_id)
     if not action:
         raise HTTPException(status_code=404, detail="Action not found")
+
+    if action["STATUS"] != "PENDING":
+        raise HTTPException(status_code=400, detail="Action already processed")
         
-    sheet_service.delete_pending_action(action_id)
+    sheet_service.mark_pending_actions([action_id], "REJECTED")
     return {"status": "REJECTED", "action_id": action_id}
 
+def _load_pending_batch(action_ids: List[str]):
+    """Selected actions that are still PENDING, plus a result for each one that isn't."""
+    actions, results = [], {}
+    action_ids = list(dict.fromkeys(action_ids)) # de-duplicated, request order
+    found = sheet_service.get_pending_actions_by_id(action_ids)
+    for action_id in action_ids:
+        action = found.get(action_id)
+        if not action:
+            results[action_id] = {"status": "NOT_FOUND", "detail": "Action not found"}
+        elif action["STATUS"] != "PENDING":
+            results[action_id] = {"status": "ALREADY_PROCESSED", "detail": "Action already processed"}
+        else:
+            actions.append(action)
+    return actions, results
+
+def _mark_processed(action_ids: List[str], status: str, results: Dict[str, dict]):
+    """One STATUS write for every processed action."""
+    try:
+        sheet_service.mark_pending_actions(action_ids, status)
+    except Exception as e:
+        for action_id in action_ids:
+            results[action_id]["detail"] = f"Processed, but still marked PENDING: {e}"
+
+def _batch_response(action_ids: List[str], results: Dict[str, dict], processed: List[str]):
+    return {
+        "processed": len(processed),
+        "results": [{"action_id": a, **results[a]} for a in dict.fromkeys(action_ids)],
+    }
+
+@router.post("/pending/approve_batch", response_model=PendingBatchResponse)
+async def approve_pending_actions_batch(request: PendingBatchRequest, current_user: User = Depends(get_current_user)):
+    """
+    Approve several queued actions at once: their movements are applied against one INVENTARIO
+    read, written with one inventory + HISTORIAL commit, and marked APPROVED in one write.
+    """
+    require_admin(current_user)
+    actions, results = _load_pending_batch(request.action_ids)
+
+    batches, batch_ids, approved = [], [], []
+    for action in actions:
+        action_id = action["ID"]
+        payload = action.get("PAYLOAD")
+        action_type = action.get("ACTION_TYPE", "MOVEMENT")
+        if payload is None:
+            results[action_id] = {"status": "ERROR", "detail": "Failed to parse action payload"}
+        elif action_type == "MOVEMENT":
+            if not isinstance(payload, list):
+                results[action_id] = {"status": "ERROR", "detail": "MOVEMENT payload must be a list of movements"}
+                continue
+            batches.append((payload, action["REQUESTER_EMAIL"], f"TX-{action_id}"))
+            batch_ids.append(action_id)
+        else:
+            # Layout updates touch Config, not INVENTARIO: applied one by one
+            try:
+                sheet_service.execute_transaction(action_type, payload, user_id=action["REQUESTER_EMAIL"], transaction_id=f"TX-{action_id}")
+                results[action_id] = {"status": "APPROVED"}
+                approved.append(action_id)
+            except Exception as e:
+                results[action_id] = {"status": "ERROR", "detail": str(e)}
+
+    if batches:
+        try:
+            sheet_service.execute_movement_batches(batches)
+            for action_id in batch_ids:
+                results[action_id] = {"status": "APPROVED"}
+            approved += batch_ids
+        except Exception as e:
+            # Committed together, so they succeed or fail together
+            for action_id in batch_ids:
+                results[action_id] = {"status": "ERROR", "detail": str(e)}
+
+    if approved:
+        _mark_processed(approved, "APPROVED", results)
+    return _batch_response(request.action_ids, results, approved)
+
+@router.post("/pending/reject_batch", response_model=PendingBatchResponse)
+async def reject_pending_actions_batch(request: PendingBatchRequest, current_user: User = Depends(get_current_user)):
+    """Reject several queued actions, marking them REJECTED in one write."""
+    require_admin(current_user)
+    actions, results = _load_pending_batch(request.action_ids)
+
+    rejected = [action["ID"] for action in actions]
+    for action_id in rejected:
+        results[action_id] = {"status": "REJECTED"}
+    if rejected:
+        _mark_processed(rejected, "REJECTED", results)
+    return _batch_response(request.action_ids, results, rejected)
+
+@router.post("/pending/compact")
+async def compact_pending_actions(current_user: User = Depends(get_current_user)):
+    """Archive approved/rejected rows of PENDING_ACTIONS now (also runs on a schedule)."""
+    require_admin(current_user)
+    try:
+        return sheet_service.compact_pending_actions()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/backup")
 async def create_database_backup(current_user: User = Depends(get_current_user)):
     require_admin(current_user)
@@ -69,6 +172,16 @@ async def create_database_backup(current_user: User = Depends(get_current_user))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/inventory/compact")
+async def compact_inventory(dry_run: bool = False, current_user: User = Depends(get_current_user)):
+    """Merge duplicate rows and purge zero-quantity rows from INVENTARIO (on demand)."""
+    require_admin(current_user)
+    try:
+        report = sheet_service.compact_inventory(dry_run=dry_run)
+        return {"status": "DRY_RUN" if dry_run else "SUCCESS", **report}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # --- USER MANAGEMENT ---
 
 @router.get("/users", response_model=List[Dict])
@@ -100,5 +213,9 @@ async def update_user_role(email: str, new_role: str, current_user: User = Depen
         sheet_service.update_user_role(email, new_role)
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+    # The new role must apply right away, not when the users cache (or a cached token) expires
+    auth_service.refresh_users()
+    auth_service.token_cache.invalidate_user(email)
         
     return {"status": "UPDATED", "email": email, "new_role": new_role}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from datetime import timedelta
+import time
 from app.models.schemas import LoginRequest, GoogleLoginRequest, RegisterRequest, Token, User
 from app.services.auth_service import auth_service
 from app.core.security import create_access_token, verify_token
@@ -10,6 +11,11 @@ router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Same token seen recently: already verified, skip the decode and the sheet lookup
+    cached_user = auth_service.token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     payload = verify_token(token)
     if not payload:
         raise HTTPException(
@@ -27,16 +33,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if not user_data:
         raise HTTPException(status_code=401, detail="User not found")
         
-    return User(
+    user = User(
         email=user_data["USER_ID"],
         role=user_data["ROLE"],
         name=user_data.get("NAME"),
         is_active=True
     )
+    if payload.get("exp"):
+        # No longer than the users cache: its refresh is what notices demoted or deleted users
+        auth_service.token_cache.put(token, user, min(float(payload["exp"]), time.time() + auth_service.CACHE_TTL))
+    return user
 
 @router.post("/login", response_model=Token)
 async def login(request: LoginRequest):
-    user = auth_service.authenticate_user(request.email, request.password)
+    user = await auth_service.authenticate_user_async(request.email, request.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     
@@ -57,7 +67,7 @@ async def login(request: LoginRequest):
 
 @router.post("/google-login", response_model=Token)
 async def google_login(request: GoogleLoginRequest):
-    email = auth_service.verify_google_token(request.token)
+    email = await auth_service.verify_google_token_async(request.token)
     if not email:
         raise HTTPException(status_code=401, detail="Invalid Google Token")
     
@@ -88,7 +98,7 @@ async def google_login(request: GoogleLoginRequest):
 @router.post("/register", response_model=Token)
 async def register(request: RegisterRequest):
     # Verify token again to ensure email ownership
-    email = auth_service.verify_google_token(request.token)
+    email = await auth_service.verify_google_token_async(request.token)
     if not email or email != request.email:
         raise HTTPException(status_code=401, detail="Invalid Google Token or Email mismatch")
 
@@ -1,26 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from typing import List, Dict, Any
+import uuid
 from app.api.auth import get_current_user
+from app.api.admin import require_admin
 from app.services.sheets_service import sheet_service
-from app.models.schemas import User
+from app.services.import_service import import_service
+from app.core.response_cache import payload_cache
+from app.models.schemas import User, InventoryImportResponse
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_inventory(current_user: User = Depends(get_current_user)):
+async def get_inventory(request: Request, current_user: User = Depends(get_current_user)):
     """
     Get current inventory from Google Sheets.
     Returns a list of records (dicts).
+
+    The JSON body (and its gzip/brotli variants) is built once per inventory
+    version; repeated calls just hand back the cached bytes.
     """
     # Optional: Restrict to authenticated users or specific roles if needed
     # For now, any logged-in user can view inventory
-    inventory = sheet_service.get_inventory()
-    if not inventory:
+    version, inventory = sheet_service.get_inventory_snapshot()
+
+    def build():
+        # DEBUG: Print first 3 items to check ID format (once per version)
+        if inventory:
+            print(f"DEBUG INVENTORY SAMPLE (first 3): {[item.get('ID_UBICACION') for item in inventory[:3]]}")
         # It might be empty or error, but we return empty list to not break frontend
-        return []
-    
-    # DEBUG: Print first 3 items to check ID format
-    if inventory:
-        print(f"DEBUG INVENTORY SAMPLE (first 3): {[item.get('ID_UBICACION') for item in inventory[:3]]}")
-    
-    return inventory
+        return inventory or []
+
+    payload = payload_cache.get("inventory", version, build)
+    response = payload.to_response(
+        request.headers.get("accept-encoding"),
+        request.headers.get("if-none-match"),
+    )
+    if sheet_service.snapshot_stale:
+        # Served from the warm-start snapshot, Sheets reconciliation still running
+        response.headers["X-Data-Stale"] = "true"
+    return response
+
+@router.get("/layout", response_model=Dict[str, Any])
+async def get_layout(current_user: User = Depends(get_current_user)):
+    """Map layout state (Config tab), served from cache / warm-start snapshot."""
+    return sheet_service.get_layout()
+
+@router.post("/import", response_model=InventoryImportResponse)
+async def import_inventory(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Bulk ENTRADA from a CSV (location, material, qty, lote, state).
+    Every row is validated first; the file is committed only if all rows are valid,
+    as a single batched transaction (one INVENTARIO write + one HISTORIAL append).
+    """
+    require_admin(current_user)
+
+    content = await file.read()
+    movements, errors, total = import_service.parse_and_validate(content)
+
+    if errors:
+        return InventoryImportResponse(status="ERROR", total_rows=total, errors=errors)
+    if not movements:
+        raise HTTPException(status_code=400, detail="El fichero CSV no contiene filas.")
+    if dry_run:
+        return InventoryImportResponse(status="VALIDATED", total_rows=total)
+
+    tx_id = f"TX-IMP-{uuid.uuid4().hex[:8]}"
+    try:
+        sheet_service.execute_transaction("MOVEMENT", movements, user_id=current_user.email, transaction_id=tx_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import failed: {e}")
+
+    return InventoryImportResponse(
+        status="SUCCESS",
+        total_rows=total,
+        imported_rows=len(movements),
+        transaction_id=tx_id
+    )
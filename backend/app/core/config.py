@@ -12,8 +12,37 @@ class Settings(BaseSettings):
     GOOGLE_APPLICATION_CREDENTIALS_JSON: str = "" # JSON content as string
     GOOGLE_CLIENT_ID: str = "856058698301-4rk59qb6j7d75r72ecntmgiv3tu126o6.apps.googleusercontent.com" # Hardcoded for now as per frontend
     
+    # NLP
+    SPACY_MODEL: str = "es_core_news_lg" # es_core_news_sm / es_core_news_md / es_core_news_lg
+    SPACY_EXCLUDE: str = "parser,ner" # Comma separated pipeline components not loaded at all
+    NLP_BATCH_SIZE: int = 64 # nlp.pipe batch size for /assistant/parse_batch
+    NLP_N_PROCESS: int = 1 # nlp.pipe worker processes for /assistant/parse_batch
+    NLP_BATCH_MAX_LINES: int = 200 # Lines accepted by /assistant/parse_batch (more -> 413)
+    NLP_WORKERS: int = 0 # spaCy tagging processes per API worker (0 = tag in a thread of the API process)
+    NLP_TIMEOUT_SECONDS: float = 2.0 # Pool answer deadline, then the request falls back to regex mode
+    SERVER_TIMING_HEADER: bool = False # Add per-stage Server-Timing headers to /assistant/parse responses
+    NLP_CACHE_SIZE: int = 1024 # Parse results kept for repeated commands (0 disables the cache)
+    NLP_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 # Approximate memory cap of the parse cache
+
     # Security
     API_KEY: str = "" # Optional: for basic protection
+    USERS_CACHE_TTL: int = 600 # seconds before USUARIOS is refreshed in the background (stale copy keeps serving)
+    USERS_CACHE_MAX_STALENESS: int = 1800 # seconds after which requests wait for a fresh USUARIOS copy
+    TOKEN_CACHE_SIZE: int = 1024 # Verified access tokens kept by get_current_user (0 disables the cache)
+    BCRYPT_ROUNDS: int = 12 # bcrypt cost of new hashes (older ones are rehashed on login)
+    AUTH_HASH_WORKERS: int = 2 # Threads per API worker running bcrypt for /auth/login
+    PASSWORD_REHASH_INTERVAL_SECONDS: int = 60 # Batch write of hashes replacing plaintext passwords (0 disables it)
+
+    # Inventory replica / response cache
+    INVENTORY_CACHE_TTL: int = 30 # seconds before the INVENTARIO replica is re-downloaded
+    SNAPSHOT_PATH: str = "/tmp/almacen_snapshot.bin" # Local warm-start snapshot ("" disables it)
+    SNAPSHOT_RECONCILE_MAX_BACKOFF_SECONDS: int = 300 # Cap of the retry delay while the snapshot is not reconciled
+    PENDING_CACHE_TTL: int = 30 # seconds before the PENDING_ACTIONS index is re-read
+    PENDING_COMPACTION_INTERVAL_HOURS: float = 6 # Archive approved/rejected PENDING_ACTIONS rows (0 disables it)
+    # Schedule the INVENTARIO / PENDING_ACTIONS compactions here. They move rows, so enable it in exactly
+    # one process (e.g. a single-worker maintenance instance); elsewhere use the /admin/.../compact endpoints.
+    RUN_MAINTENANCE_JOBS: bool = False
+    INVENTORY_COMPACTION_INTERVAL_HOURS: float = 24 # Scheduled INVENTARIO compaction (0 disables it)
 
     class Config:
         case_sensitive = True
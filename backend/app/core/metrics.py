@@ -0,0 +1,113 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+class Histogram:
+    """Fixed-bucket latency histogram (ms), cheap enough to update on every request."""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max, 3),
+            "buckets": {("+Inf" if i == len(LATENCY_BUCKETS_MS) else str(LATENCY_BUCKETS_MS[i])): c
+                        for i, c in enumerate(self.counts)},
+        }
+
+class Metrics:
+    """Process-wide registry of named latency histograms (e.g. 'parse.tokenize')."""
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, ms: float):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: h.to_dict() for name, h in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+metrics = Metrics()
+
+class StageTimer:
+    """
+    Per-request stage timings. Stages entered several times (e.g. once per clause) add up.
+    record() feeds them to the histograms as '<prefix>.<stage>'; server_timing() renders the
+    Server-Timing header value.
+    """
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def record(self):
+        self.stages["total"] = (time.perf_counter() - self._start) * 1000
+        for name, ms in self.stages.items():
+            metrics.observe(f"{self.prefix}.{name}", ms)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.stages.items())
+
+class _NoTimer:
+    """Stand-in when the caller doesn't time anything: stage() costs one call."""
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def add(self, name: str, ms: float):
+        pass
+
+NO_TIMER = _NoTimer()
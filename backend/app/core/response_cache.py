@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional
+from fastapi.responses import JSONResponse, Response
+
+# Optional accelerators: the app keeps working (slower / without br) if missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: same contract as JSONResponse, faster encoder."""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class EncodedPayload:
+    """A JSON body serialized once, with its compressed variants."""
+    __slots__ = ("version", "bodies", "etag")
+
+    def __init__(self, version: int, content: Any):
+        raw = dumps(content)
+        self.version = version
+        self.bodies: Dict[str, bytes] = {
+            "identity": raw,
+            "gzip": gzip.compress(raw, compresslevel=GZIP_LEVEL),
+        }
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(raw, quality=BROTLI_QUALITY)
+        self.etag = f'"{version}-{hashlib.blake2b(raw, digest_size=8).hexdigest()}"'
+
+    def negotiate(self, accept_encoding: Optional[str]) -> str:
+        """Pick the smallest encoding the client accepts (q > 0)."""
+        if not accept_encoding:
+            return "identity"
+        accepted = {}
+        for part in accept_encoding.split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip().lower()] = q
+
+        for enc in ("br", "gzip"):
+            q = accepted.get(enc, accepted.get("*", 0.0))
+            if enc in self.bodies and q > 0:
+                return enc
+        return "identity"
+
+    def to_response(self, accept_encoding: Optional[str], if_none_match: Optional[str] = None) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if if_none_match and self.etag in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        encoding = self.negotiate(accept_encoding)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.bodies[encoding], media_type="application/json", headers=headers)
+
+class PayloadCache:
+    """Keeps the latest EncodedPayload per key, rebuilt only when the version changes."""
+    def __init__(self):
+        self._entries: Dict[str, EncodedPayload] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version: int, build: Callable[[], Any]) -> EncodedPayload:
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            return entry
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                entry = EncodedPayload(version, build())
+                self._entries[key] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+payload_cache = PayloadCache()
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Callable, List
+from fastapi.concurrency import run_in_threadpool
+
+async def _run_periodically(name: str, interval_seconds: float, func: Callable):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            # Jobs talk to Sheets synchronously, keep them off the event loop
+            await run_in_threadpool(func)
+        except Exception as e:
+            print(f"SCHEDULER ERROR: Job '{name}' failed. {e}")
+
+class Scheduler:
+    """Minimal in-process periodic jobs, started/stopped from the app lifespan."""
+    def __init__(self):
+        self._jobs = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, interval_seconds: float, func: Callable):
+        if interval_seconds and interval_seconds > 0:
+            self._jobs.append((name, interval_seconds, func))
+
+    def start(self):
+        for name, interval, func in self._jobs:
+            self._tasks.append(asyncio.create_task(_run_periodically(name, interval, func)))
+            print(f"SCHEDULER: '{name}' every {interval:.0f}s")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+scheduler = Scheduler()
@@ -1,9 +1,10 @@
+import gc
 import os
-import json
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
+from app.core.response_cache import FastJSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -11,6 +12,12 @@ from slowapi.middleware import SlowAPIMiddleware
 
 limiter = Limiter(key_func=get_remote_address, default_limits=["120/minute"])
 from app.api import assistant, auth, admin, inventory
+from app.services.sheets_service import sheet_service
+from app.services.nlp_service import nlp_service
+from app.services.nlp_pool import nlp_pool
+from app.services.auth_service import auth_service
+from app.core.scheduler import scheduler
+from app.core.metrics import metrics
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -27,8 +34,25 @@ async def lifespan(app: FastAPI):
             print(f"Error loading credentials: {e}")
     else:
         print("No credentials provided in env vars.")
+
+    # Load spaCy in the background; parse() uses the regex fallback meanwhile
+    nlp_service.start_background_load()
+
+    # Serve from the local snapshot immediately, reconcile with Sheets in background
+    sheet_service.warm_start()
+
+    # Periodic maintenance jobs
+    if settings.RUN_MAINTENANCE_JOBS:
+        # Compaction moves rows: only the one designated process does it (admin endpoints otherwise)
+        scheduler.add_job("inventory-compaction", settings.INVENTORY_COMPACTION_INTERVAL_HOURS * 3600, sheet_service.compact_inventory)
+        scheduler.add_job("pending-compaction", settings.PENDING_COMPACTION_INTERVAL_HOURS * 3600, sheet_service.compact_pending_actions)
+    scheduler.add_job("password-rehash", settings.PASSWORD_REHASH_INTERVAL_SECONDS, auth_service.flush_password_rehash)
+    scheduler.start()
     
     yield
+    await scheduler.stop()
+    auth_service.flush_password_rehash() # don't lose hashes queued since the last run
+    nlp_pool.shutdown()
     # Cleanup
     if os.path.exists("/tmp/credentials.json"):
         os.remove("/tmp/credentials.json")
@@ -38,6 +62,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 app.state.limiter = limiter
@@ -65,10 +90,35 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "data_stale": sheet_service.snapshot_stale, "nlp": nlp_service.status(),
+            "token_cache": auth_service.token_cache.stats()}
+
+@app.get("/metrics")
+def metrics_snapshot():
+    """Latency histograms per stage (e.g. parse.tokenize, parse.suggest, parse.total)."""
+    return metrics.snapshot()
 
 # Include routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(assistant.router, prefix="/api/v1/assistant", tags=["Assistant"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 app.include_router(inventory.router, prefix="/api/v1/inventory", tags=["Inventory"])
+
+def preload():
+    """
+    Load the heavy read-only state (spaCy model, location tables) in the current process.
+    Called in the Gunicorn master (preload_app) so forked workers share those pages copy-on-write;
+    gc.freeze() keeps the collector from touching (and so copying) them in the workers.
+    Nothing with sockets or threads is created here: Sheets, Vision and the scheduler start per worker.
+    """
+    if not nlp_pool.enabled: # pool processes are spawned and load their own copy
+        nlp_service.load_model()
+    sheet_service.resolve_location("") # builds the canonical location map
+    gc.collect()
+    gc.freeze()
+
+def create_app(preload_models: bool = True) -> FastAPI:
+    """App factory for Gunicorn: gunicorn -c gunicorn.conf.py "app.main:create_app()"."""
+    if preload_models:
+        preload()
+    return app
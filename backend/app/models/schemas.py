@@ -56,6 +56,19 @@ class AssistantParseResponse(BaseModel):
     token: Optional[str] = None # Signed JWT containing the interpretation
     error: Optional[str] = None
 
+class AssistantParseBatchRequest(BaseModel):
+    text: Optional[str] = None # Multi-line delivery note, one movement per line
+    lines: Optional[List[str]] = None # Or the lines already split
+    user_id: Optional[str] = None
+
+class AssistantParseBatchResponse(BaseModel):
+    status: Literal["PROPOSAL_READY", "ERROR"]
+    lines: List[str] = []
+    interpretations: List[Interpretation] = [] # One per line, same order
+    warnings: List[str] = []
+    token: Optional[str] = None # Signed JWT with all the movements of the batch
+    error: Optional[str] = None
+
 class AssistantConfirmRequest(BaseModel):
     token: str
     user_id: str
@@ -71,6 +84,29 @@ class SubmitActionRequest(BaseModel):
     action_type: str
     payload: Dict[str, Any]
 
+class ImportRowError(BaseModel):
+    row: int # 1-based line number in the uploaded CSV
+    errors: List[str]
+
+class InventoryImportResponse(BaseModel):
+    status: Literal["SUCCESS", "VALIDATED", "ERROR"]
+    total_rows: int
+    imported_rows: int = 0
+    errors: List[ImportRowError] = []
+    transaction_id: Optional[str] = None
+
+class PendingBatchRequest(BaseModel):
+    action_ids: List[str] = Field(..., min_length=1)
+
+class PendingActionResult(BaseModel):
+    action_id: str
+    status: Literal["APPROVED", "REJECTED", "NOT_FOUND", "ALREADY_PROCESSED", "ERROR"]
+    detail: Optional[str] = None
+
+class PendingBatchResponse(BaseModel):
+    processed: int # approved / rejected actions
+    results: List[PendingActionResult]
+
 # --- SHEETS ROW MODELS (Internal) ---
 class LogRow(BaseModel):
     timestamp: str
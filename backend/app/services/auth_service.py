@@ -1,21 +1,147 @@
-from typing import Optional, Dict
+import asyncio
+import hmac
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple
 from passlib.context import CryptContext
 from google.oauth2 import id_token
+from google.auth import transport
 from google.auth.transport import requests
+from starlette.concurrency import run_in_threadpool
+from requests import Session
 from app.services.sheets_service import sheet_service
 from app.core.config import get_settings
+from app.models.schemas import User
 
+import hashlib
+import re
+import threading
 import time
 
 settings = get_settings()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# Header variations of the email column in USUARIOS, by priority
+EMAIL_HEADERS = ["USER_ID", "USER ID", "ID", "EMAIL"]
+
+def normalize_email(email) -> str:
+    return str(email or "").strip().lower()
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+GOOGLE_REQUEST_TIMEOUT = 120 # seconds, google-auth's own default for its requests transport
+
+class _CachedResponse(transport.Response):
+    def __init__(self, response):
+        self._status, self._headers, self._data = response.status, dict(response.headers), response.data
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def data(self):
+        return self._data
+
+class CachingRequest(transport.Request):
+    """
+    google-auth transport over one pooled requests.Session that keeps successful GET responses
+    (Google's signing certificates) for the Cache-Control max-age the server sent.
+    """
+    def __init__(self):
+        self._request = requests.Request(session=Session())
+        self._cache: Dict[str, Tuple[_CachedResponse, float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=GOOGLE_REQUEST_TIMEOUT, **kwargs):
+        if method != "GET" or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+
+        response = _CachedResponse(self._request(url, method=method, headers=headers, timeout=timeout, **kwargs))
+        cache_control = next((v for k, v in response.headers.items() if k.lower() == "cache-control"), "")
+        max_age = MAX_AGE_RE.search(cache_control)
+        if response.status == 200 and max_age and "no-store" not in cache_control:
+            with self._lock:
+                self._cache[url] = (response, time.time() + int(max_age.group(1)))
+            print(f"AUTH CACHE: Cached {url} for {max_age.group(1)}s.")
+        return response
+
+class TokenCache:
+    """
+    Bounded LRU of sha256(access token) -> verified User, so repeated calls with the same
+    token skip the JWT decode and the User rebuild. Entries expire with the token's exp claim
+    (or USERS_CACHE_TTL, if sooner) and are dropped when the user's record changes (role
+    change, removal).
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[User]:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, user: User, expires_at: float):
+        if self.max_entries <= 0 or expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[self.key(token)] = (user, expires_at)
+            self._entries.move_to_end(self.key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, email: str):
+        email = normalize_email(email)
+        with self._lock:
+            for key in [k for k, (user, _) in self._entries.items() if normalize_email(user.email) == email]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
 
 class AuthService:
     def __init__(self):
-        self._users_cache = None
+        self._users_index = None # normalized email -> user record (USER_ID key normalized)
         self._users_cache_time = 0
-        self.CACHE_TTL = 600  # 10 minutes cache expiration
+        self._users_from_snapshot = False
+        self.CACHE_TTL = settings.USERS_CACHE_TTL # age at which a background refresh starts
+        self.MAX_STALENESS = max(settings.USERS_CACHE_MAX_STALENESS, self.CACHE_TTL) # age at which requests wait for it
+        self._refresh_lock = threading.Lock() # guards _refreshing (one background refresh at a time)
+        self._refreshing = False
+        self.token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+        self._google_request = None # created on first use, after the worker fork
+        self._hash_executor = None # bounded bcrypt threads, created on first login (after the fork)
+        self._rehash_lock = threading.Lock()
+        self._pending_rehash: Dict[str, Tuple[str, str]] = {} # email -> (stored value, new bcrypt hash)
         
     def verify_password(self, plain_password, hashed_password):
         try:
@@ -26,32 +152,82 @@ class AuthService:
     def get_password_hash(self, password):
         return pwd_context.hash(password)
 
-    def _fetch_users_with_cache(self):
+    def _build_index(self, users) -> Dict[str, Dict]:
+        """Index USUARIOS records by normalized email, resolving header variations once per refresh."""
+        index = {}
+        for user in users:
+            # Handle potential header variations (USER_ID vs USER ID vs ID vs EMAIL)
+            user_email = next((user.get(h) for h in EMAIL_HEADERS if user.get(h)), None)
+            key = normalize_email(user_email)
+            if key and key not in index: # first row wins, as the sheet scan did
+                # Normalize keys for the rest of the app to ensure consistency
+                index[key] = dict(user, USER_ID=str(user_email).strip())
+        return index
+
+    def _fetch_users_with_cache(self) -> Dict[str, Dict]:
         current_time = time.time()
-        if self._users_cache is None or (current_time - self._users_cache_time) > self.CACHE_TTL:
-            try:
-                self._users_cache = sheet_service.get_users()
+        if self._users_index is None or self._users_from_snapshot:
+            # Warm start: use the on-disk snapshot while Sheets is reconciled in the background,
+            # then adopt the reconciled copy as soon as it is available.
+            snapshot_users = sheet_service.peek_users()
+            if snapshot_users is not None and (self._users_index is None or not sheet_service.snapshot_stale):
+                self._users_index = self._build_index(snapshot_users)
                 self._users_cache_time = current_time
-                print(f"AUTH CACHE: Refreshed users from Sheets. Total: {len(self._users_cache)}")
-            except Exception as e:
-                print(f"AUTH ERROR: Failed to fetch users for cache: {e}")
-                if self._users_cache is None:
-                    return [] # Fallback to empty if initial fetch fails
-        return self._users_cache
+                self._users_from_snapshot = sheet_service.snapshot_stale
+                print(f"AUTH CACHE: Using {len(self._users_index)} users from {'snapshot' if self._users_from_snapshot else 'reconciled sheet'}.")
+        age = current_time - self._users_cache_time
+        if self._users_index is None or age > self.MAX_STALENESS:
+            self.refresh_users()
+        elif age > self.CACHE_TTL:
+            # Stale-while-revalidate: keep answering from the current copy
+            self.refresh_users(background=True)
+        return self._users_index if self._users_index is not None else {} # Fallback to empty if initial fetch fails
+
+    def refresh_users(self, background: bool = False) -> bool:
+        """
+        Re-download USUARIOS into the index. Also the force-refresh hook for role changes and
+        registrations. background=True returns at once (a refresh already running is reused).
+        """
+        if background:
+            with self._refresh_lock:
+                if self._refreshing:
+                    return False
+                self._refreshing = True
+            threading.Thread(target=self._refresh_users, name="users-refresh", daemon=True).start()
+            return True
+        with self._refresh_lock:
+            self._refreshing = True
+        return self._refresh_users()
+
+    def _refresh_users(self) -> bool:
+        try:
+            users = sheet_service.get_users()
+            if not users and self._users_index:
+                # get_users() reports Sheets errors as an empty list: keep serving the last copy
+                raise Exception("Sheets returned no users")
+            old_index, self._users_index = self._users_index or {}, self._build_index(users)
+            # Cached tokens of users whose record changed or disappeared must be verified again
+            for email, old in old_index.items():
+                new = self._users_index.get(email)
+                if new is None or new.get("ROLE") != old.get("ROLE") or new.get("NAME") != old.get("NAME"):
+                    self.token_cache.invalidate_user(email)
+            self._users_cache_time = time.time()
+            self._users_from_snapshot = False
+            print(f"AUTH CACHE: Refreshed users from Sheets. Total: {len(self._users_index)}")
+            return True
+        except Exception as e:
+            print(f"AUTH ERROR: Failed to fetch users for cache: {e}")
+            return False
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
 
     def get_user_from_sheet(self, email: str) -> Optional[Dict]:
-        users = self._fetch_users_with_cache()
         # Header: USER_ID, ROLE, NAME, PASSWORD
-        for user in users:
-            # Handle potential header variations (USER_ID vs USER ID vs ID vs EMAIL)
-            user_email = user.get("USER_ID") or user.get("USER ID") or user.get("ID") or user.get("EMAIL")
-            # print(f"DEBUG: Checking user {user_email} against {email}")
-            
-            if user_email and str(user_email).strip() == str(email).strip():
-                # Normalize keys for the rest of the app to ensure consistency
-                user["USER_ID"] = user_email
-                return user.copy() # Return a copy to prevent accidental cache modification
-        return None
+        user = self._fetch_users_with_cache().get(normalize_email(email))
+        if user is None:
+            return None
+        return user.copy() # Return a copy to prevent accidental cache modification
 
     def authenticate_user(self, email: str, password: str):
         user = self.get_user_from_sheet(email)
@@ -62,31 +238,80 @@ class AuthService:
         stored_hash = user.get("PASSWORD")
         if not stored_hash:
              return None # Manual login requires password
+        stored_hash = str(stored_hash).strip()
              
         # 1. Try secure hash verification
-        if self.verify_password(password, stored_hash):
+        if pwd_context.identify(stored_hash):
+            try:
+                valid, new_hash = pwd_context.verify_and_update(password, stored_hash)
+            except Exception:
+                return None
+            if not valid:
+                return None
+            if new_hash: # hashed with other BCRYPT_ROUNDS
+                self._queue_rehash(user["USER_ID"], stored_hash, new_hash)
             user["ROLE"] = str(user["ROLE"]).upper()
             return user
             
-        # 2. Fallback: Plain text comparison (for manually edited Sheets)
-        # WARNING: In production, always use hashes.
-        if str(stored_hash).strip() == password.strip():
+        # 2. Fallback: Plain text comparison (for manually edited Sheets),
+        # the sheet gets a bcrypt hash instead in the next rehash batch.
+        # The input is used as typed, like in the bcrypt branch, so the hash stored here
+        # accepts exactly the passwords this comparison accepted
+        if hmac.compare_digest(stored_hash.encode(), password.encode()):
+            try:
+                self._queue_rehash(user["USER_ID"], stored_hash, pwd_context.hash(password))
+            except Exception as e:
+                print(f"AUTH ERROR: Could not hash password for {user['USER_ID']}, keeping it as is. {e}")
             user["ROLE"] = str(user["ROLE"]).upper()
             return user
             
         return None
 
+    async def authenticate_user_async(self, email: str, password: str):
+        """authenticate_user() on the bcrypt threads, so hashing never stalls the event loop."""
+        if self._hash_executor is None:
+            self._hash_executor = ThreadPoolExecutor(max_workers=settings.AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+        return await asyncio.get_running_loop().run_in_executor(self._hash_executor, self.authenticate_user, email, password)
+
+    def _queue_rehash(self, email: str, stored_value: str, new_hash: str):
+        with self._rehash_lock:
+            self._pending_rehash[normalize_email(email)] = (stored_value, new_hash)
+        # Later logins already check the hash, whether or not the batch was written yet
+        cached = (self._users_index or {}).get(normalize_email(email))
+        if cached is not None:
+            cached["PASSWORD"] = new_hash
+
+    def flush_password_rehash(self) -> int:
+        """Write the queued password hashes to USUARIOS in one batch (scheduled job)."""
+        with self._rehash_lock:
+            pending, self._pending_rehash = self._pending_rehash, {}
+        if not pending:
+            return 0
+        try:
+            written = sheet_service.update_user_passwords(pending)
+            print(f"AUTH: Stored bcrypt hashes for {written}/{len(pending)} users.")
+            return written
+        except Exception as e:
+            print(f"AUTH ERROR: Could not store password hashes, retrying later. {e}")
+            with self._rehash_lock:
+                for email, change in pending.items():
+                    self._pending_rehash.setdefault(email, change)
+            return 0
+
     def verify_google_token(self, token: str) -> Optional[str]:
         """Verifies Google ID Token and returns the email if valid."""
         try:
             # Verify token signature. 
             # We strictly check the audience now.
+            # Certificates come from the shared transport's cache while Google's max-age lasts
+            if self._google_request is None:
+                self._google_request = CachingRequest()
             client_id = settings.GOOGLE_CLIENT_ID
             if not client_id:
                 print("WARNING: GOOGLE_CLIENT_ID not set in backend config. Skipping audience check.")
-                id_info = id_token.verify_oauth2_token(token, requests.Request())
+                id_info = id_token.verify_oauth2_token(token, self._google_request)
             else:
-                id_info = id_token.verify_oauth2_token(token, requests.Request(), audience=client_id)
+                id_info = id_token.verify_oauth2_token(token, self._google_request, audience=client_id)
             
             email = id_info.get("email")
             return email
@@ -99,6 +324,10 @@ class AuthService:
             traceback.print_exc()
             return None
 
+    async def verify_google_token_async(self, token: str) -> Optional[str]:
+        """verify_google_token() off the event loop (a certificate download may block)."""
+        return await run_in_threadpool(self.verify_google_token, token)
+
     def create_user(self, email: str, name: str, role: str = "VISITOR"):
         user_data = {
             "email": email,
@@ -108,14 +337,16 @@ class AuthService:
         sheet_service.add_user(user_data)
         
         # Invalidate or eagerly update cache
-        if self._users_cache is not None:
+        if self._users_index is not None:
             new_user_cache_entry = {
                 "USER_ID": email,
                 "ROLE": role.upper(),
                 "NAME": name,
                 "PASSWORD": ""
             }
-            self._users_cache.append(new_user_cache_entry)
+            self._users_index.setdefault(normalize_email(email), new_user_cache_entry)
+        # Pick up the row as stored in the sheet without making the new user wait for it
+        self.refresh_users(background=True)
             
         return user_data
 
@@ -0,0 +1,105 @@
+import csv
+import io
+from typing import List, Tuple, Dict, Any
+from app.models.schemas import ActionType, MaterialState, ImportRowError
+from app.services.sheets_service import sheet_service
+
+# Accepted header names for each CSV column (compared lowercase)
+COLUMN_ALIASES = {
+    "location": ["location", "ubicacion", "ubicación", "id_ubicacion", "id_lugar", "lugar", "id_registro"],
+    "material": ["material", "item"],
+    "qty": ["qty", "cantidad", "quantity", "unidades"],
+    "lote": ["lote", "programa", "program"],
+    "state": ["state", "estado"],
+}
+# Column order used when the file has no header row
+DEFAULT_ORDER = ["location", "material", "qty", "lote", "state"]
+
+class ImportService:
+    def _decode(self, content: bytes) -> str:
+        try:
+            return content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return content.decode("latin-1") # Excel exports on Windows
+
+    def _read_rows(self, text: str) -> Tuple[Dict[str, int], List[Tuple[int, List[str]]]]:
+        """Return (column -> index, [(line_number, cells)]) handling ',' or ';' separated files."""
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = [(i, r) for i, r in enumerate(csv.reader(io.StringIO(text), dialect), start=1) if any(c.strip() for c in r)]
+        if not rows:
+            return {}, []
+
+        first = [c.strip().lower() for c in rows[0][1]]
+        columns = {}
+        for col, aliases in COLUMN_ALIASES.items():
+            for idx, name in enumerate(first):
+                if name in aliases:
+                    columns[col] = idx
+                    break
+
+        if "location" in columns and "material" in columns:
+            return columns, rows[1:]
+        # No recognizable header: positional columns
+        return {col: idx for idx, col in enumerate(DEFAULT_ORDER)}, rows
+
+    def parse_and_validate(self, content: bytes) -> Tuple[List[Dict[str, Any]], List[ImportRowError], int]:
+        """
+        Parse the CSV and validate every row in memory against the location registry.
+        Returns (movements, errors, total_rows). Movements are only meaningful if errors is empty.
+        """
+        columns, rows = self._read_rows(self._decode(content))
+        valid_states = {s.value for s in MaterialState}
+
+        movements = []
+        errors = []
+        for line_no, cells in rows:
+            def cell(col):
+                idx = columns.get(col)
+                return cells[idx].strip() if idx is not None and idx < len(cells) else ""
+
+            row_errors = []
+            raw_loc = cell("location")
+            location = sheet_service.resolve_location(raw_loc)
+            if not raw_loc:
+                row_errors.append("Falta la ubicación")
+            elif not location:
+                row_errors.append(f"Ubicación desconocida: '{raw_loc}'")
+
+            material = cell("material")
+            if not material:
+                row_errors.append("Falta el material")
+
+            qty = 0
+            raw_qty = cell("qty")
+            try:
+                qty = int(raw_qty)
+                if qty <= 0:
+                    row_errors.append(f"La cantidad debe ser positiva: '{raw_qty}'")
+            except ValueError:
+                row_errors.append(f"Cantidad no válida: '{raw_qty}'")
+
+            state = (cell("state") or MaterialState.STOCK.value).upper()
+            if state not in valid_states:
+                row_errors.append(f"Estado no válido: '{state}' (válidos: {', '.join(sorted(valid_states))})")
+
+            if row_errors:
+                errors.append(ImportRowError(row=line_no, errors=row_errors))
+                continue
+
+            movements.append({
+                "type": ActionType.ENTRADA.value,
+                "item": material,
+                "qty": qty,
+                "origin": "EXTERNO",
+                "destination": location,
+                "program": cell("lote"),
+                "state": state,
+                "reason": "IMPORTACION CSV",
+            })
+
+        return movements, errors, len(rows)
+
+import_service = ImportService()
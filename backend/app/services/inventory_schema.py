@@ -0,0 +1,139 @@
+import re
+from typing import Optional, List, Dict
+from app.static_data import SCHEMA_V2
+
+# Any of these in a row marks it as the INVENTARIO header row
+HEADER_MARKERS = ["ID_UBICACION", "ID_LUGAR", "ID_REGISTRO", "LUGAR", "UBICACION"]
+# Location column candidates for the legacy (single location column) layout, by priority
+LEGACY_LOCATION_HEADERS = ["ID_UBICACION", "ID_LUGAR", "LUGAR", "UBICACION"]
+# Header variants exposed as ID_UBICACION / ID_LUGAR / ID_REGISTRO in parsed records
+LUGAR_ALIASES = ["ID_LUGAR", "LUGAR", "UBICACION"]
+REGISTRO_ALIASES = ["ID_REGISTRO", "REGISTRO"]
+# Split location columns that identify the V2 layout (ID_LUGAR, MODULO, ALTURA)
+V2_MARKERS = [SCHEMA_V2[col] for col in ("C", "D", "E")]
+# ID_REGISTRO of a shelf row ('E1', 'E1-M2-A3'); pallets are 'P-1' or a bare number
+SHELF_REGISTRO_RE = re.compile(r"E\d+(-|$)", re.IGNORECASE)
+
+class InventorySchema:
+    """
+    Column layout of the INVENTARIO tab, detected once and reused by every read/write path.
+
+    - V2 (SCHEMA_V2): ID_LUGAR + MODULO + ALTURA split columns, full location = E<lugar>-M<mod>-A<alt>.
+    - LEGACY: a single location column (ID_UBICACION / ID_LUGAR / ...).
+    """
+    def __init__(self, header_row: int, raw_header: List[str]):
+        self.header_row = header_row
+        self.raw_header = list(raw_header)
+        self.headers = [str(c).strip() for c in raw_header] # original casing, stripped
+        self.columns: Dict[str, int] = {}
+        for i, h in enumerate(self.headers):
+            if h and h.upper() not in self.columns:
+                self.columns[h.upper()] = i
+
+        self.layout = "V2" if all(h in self.columns for h in V2_MARKERS) else "LEGACY"
+        self.idx_material = self.columns.get("MATERIAL", -1)
+        self.idx_qty = self.columns.get("CANTIDAD", -1)
+        self.idx_location = next((self.columns[h] for h in LEGACY_LOCATION_HEADERS if h in self.columns), -1)
+
+    @property
+    def data_start(self) -> int:
+        """Index (0-based, in get_all_values) of the first data row."""
+        return self.header_row + 1
+
+    @property
+    def writable(self) -> bool:
+        return self.idx_material != -1 and self.idx_qty != -1 and (self.idx_location != -1 or "ID_REGISTRO" in self.columns)
+
+    def matches(self, values: List[List[str]]) -> bool:
+        """True if values still have this exact header row (cheap check, no scan)."""
+        return len(values) > self.header_row and values[self.header_row] == self.raw_header
+
+    def cell(self, row: List[str], name: str) -> str:
+        i = self.columns.get(name, -1)
+        return str(row[i]).strip() if 0 <= i < len(row) else ""
+
+    def is_shelf(self, row: List[str]) -> bool:
+        """V2 row on a shelf: TIPO_UBICACION 'Estantería', or an ID_REGISTRO like 'E1' / 'E1-M2'."""
+        if self.cell(row, "TIPO_UBICACION").upper().startswith("ESTANT"):
+            return True
+        return bool(SHELF_REGISTRO_RE.match(self.cell(row, "ID_REGISTRO")))
+
+    def location_key(self, row: List[str]) -> str:
+        """Full location of a row: 'E1-M2-A3' (or 'E1', whole shelf) for shelves, the pallet/zone ID otherwise (upper-cased)."""
+        lugar = self.cell(row, "ID_LUGAR") or (str(row[self.idx_location]).strip() if 0 <= self.idx_location < len(row) else "")
+        if self.layout == "V2":
+            modulo, altura = self.cell(row, "MODULO"), self.cell(row, "ALTURA")
+            if lugar and (modulo or self.is_shelf(row)):
+                shelf = lugar if lugar.upper().startswith("E") else f"E{lugar}"
+                lugar = shelf
+                if modulo:
+                    lugar = f"{shelf}-M{modulo}-A{altura}" if altura else f"{shelf}-M{modulo}"
+        return (lugar or self.cell(row, "ID_REGISTRO")).upper()
+
+    def quantity(self, row: List[str]) -> Optional[int]:
+        try:
+            return int(str(row[self.idx_qty]).strip())
+        except (IndexError, ValueError):
+            return None
+
+    def to_record(self, row: List[str]) -> dict:
+        """Row -> dict keyed by header, with ID_UBICACION / ID_LUGAR / ID_REGISTRO aliases."""
+        item = {}
+        for idx, header in enumerate(self.headers):
+            if idx < len(row) and header: # Only map if header exists
+                upper_h = header.upper()
+                # Map LUGAR variants to ID_UBICACION for compatibility
+                item["ID_UBICACION" if upper_h in LUGAR_ALIASES else header] = row[idx]
+                # Keep original too just in case
+                if upper_h in LUGAR_ALIASES:
+                    item["ID_LUGAR"] = row[idx]
+                if upper_h in REGISTRO_ALIASES:
+                    item["ID_REGISTRO"] = row[idx]
+        return item
+
+    def new_row(self, location: str, material: str, qty: int, lote: str = "", state: str = "STOCK",
+                responsible: str = "", item_type: str = "Caja") -> List:
+        """Build a row for append_rows in this layout."""
+        width = max(i for i, h in enumerate(self.headers) if h) + 1 # ignore trailing blank headers
+        row = [""] * width
+
+        def put(name, value):
+            i = self.columns.get(name, -1)
+            if i != -1:
+                row[i] = value
+
+        if self.layout == "V2":
+            # Determine if it's a shelf location (e.g. E1-M1-A2) and split Modulo / Altura
+            is_shelf = location.upper().startswith("E")
+            id_lugar, modulo, altura = location, "", ""
+            if is_shelf:
+                parts = location.split('-')
+                id_lugar = parts[0][1:] if len(parts) > 0 else location
+                modulo = parts[1][1:] if len(parts) > 1 else ""
+                altura = parts[2][1:] if len(parts) > 2 else ""
+            # ID_REGISTRO is where it's located (pallet ID or full location string)
+            put("ID_REGISTRO", location)
+            put("TIPO_UBICACION", "Estantería" if is_shelf else "Palet")
+            put("ID_LUGAR", id_lugar)
+            put("MODULO", modulo)
+            put("ALTURA", altura)
+        elif self.idx_location != -1:
+            row[self.idx_location] = location
+        else:
+            put("ID_REGISTRO", location)
+
+        put("TIPO_ITEM", item_type)
+        put("MATERIAL", material)
+        put("CANTIDAD", qty)
+        put("LOTE", lote) # Program goes here based on user confirmation
+        put("ESTADO", state)
+        put("RESPONSABLE", responsible)
+        return row
+
+def detect_inventory_schema(values: List[List[str]]) -> Optional[InventorySchema]:
+    """Find the header row (it is not always row 1) and build the schema, or None."""
+    for i, row in enumerate(values):
+        normalized_row = [str(c).strip().upper() for c in row]
+        if any(h in normalized_row for h in HEADER_MARKERS):
+            return InventorySchema(i, row)
+    return None
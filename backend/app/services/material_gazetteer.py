@@ -0,0 +1,110 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WORD_RE = re.compile(r"\w+")
+_END = "\0" # trie key holding the stored material name
+
+def stem(word: str) -> str:
+    """
+    Word normalization shared by stored names and user text: lower case, no accents,
+    and a crude singular ("sillas" -> "silla", "balones"/"balón" -> "balon", "cables"/"cable" -> "cabl").
+    """
+    word = ''.join(c for c in unicodedata.normalize('NFD', word.lower()) if unicodedata.category(c) != 'Mn')
+    if len(word) > 3 and word.endswith("s"):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+def material_key(name: str) -> Tuple[str, ...]:
+    return tuple(stem(w) for w in WORD_RE.findall(str(name)))
+
+class MaterialGazetteer:
+    """
+    Word trie of the distinct MATERIAL names in INVENTARIO, so material mentions resolve
+    to the stored name with a direct lookup (longest match wins: "cajas de balones" beats "cajas").
+    Kept in sync with the inventory version; only added/removed names touch the trie, and
+    `version` only moves when the set of names changes (parse cache keys include it).
+    """
+    def __init__(self):
+        self._trie: Dict = {}
+        self._names: Dict[Tuple[str, ...], str] = {} # key -> stored name
+        self._lock = threading.Lock()
+        self.source_version = None # inventory version the trie was built from
+        self.version = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def sync(self, inventory_version: int, materials: Iterable[str]) -> bool:
+        """Apply the material names of an inventory version. Returns True if the set changed."""
+        if inventory_version == self.source_version:
+            return False
+        wanted = {}
+        for name in materials:
+            name = str(name or "").strip()
+            key = material_key(name)
+            if key and key not in wanted:
+                wanted[key] = name
+
+        with self._lock:
+            removed = [k for k in self._names if k not in wanted]
+            added = [k for k in wanted if k not in self._names]
+            for key in removed:
+                self._remove(key)
+            for key in added:
+                self._add(key, wanted[key])
+            self.source_version = inventory_version
+            if removed or added:
+                self.version += 1
+                print(f"NLP: Material gazetteer v{self.version}: {len(self._names)} names (+{len(added)} / -{len(removed)}).")
+            return bool(removed or added)
+
+    def _add(self, key: Tuple[str, ...], name: str):
+        node = self._trie
+        for word in key:
+            node = node.setdefault(word, {})
+        node[_END] = name
+        self._names[key] = name
+
+    def _remove(self, key: Tuple[str, ...]):
+        node = self._trie
+        for word in key:
+            node = node.get(word)
+            if node is None:
+                break
+        else:
+            node.pop(_END, None) # empty branches are left behind, they never match
+        del self._names[key]
+
+    def contains(self, name: str) -> bool:
+        return material_key(name) in self._names
+
+    def find(self, text: str, masked: Optional[List[Tuple[int, int, str]]] = None,
+             start: int = 0, end: Optional[int] = None) -> List[str]:
+        """Stored names mentioned in text[start:end], in order of appearance, skipping masked (location) spans."""
+        masked = masked or []
+        # Masked words become None so a name can't match across a location
+        words = [
+            None if any(m.start() < m_end and m.end() > m_start for m_start, m_end, _ in masked) else stem(m.group(0))
+            for m in WORD_RE.finditer(text, start, len(text) if end is None else end)
+        ]
+        found = []
+        i = 0
+        while i < len(words):
+            node, match, match_end = self._trie, None, i
+            for j in range(i, len(words)):
+                node = node.get(words[j]) if words[j] is not None else None
+                if node is None:
+                    break
+                if _END in node:
+                    match, match_end = node[_END], j
+            if match is None:
+                i += 1
+                continue
+            if match not in found:
+                found.append(match)
+            i = match_end + 1
+        return found
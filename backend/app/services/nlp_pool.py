@@ -0,0 +1,120 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Per-process NLPService of a pool worker (model loaded once by _init_worker)
+_worker_service = None
+
+def _init_worker(model_name: str, exclude: str):
+    global _worker_service
+    from app.services.nlp_service import NLPService
+    _worker_service = NLPService()
+    _worker_service.load_model(model_name, [c.strip() for c in exclude.split(",") if c.strip()])
+
+def _worker_analyze(texts: List[str]):
+    return _worker_service.analyze(texts)
+
+def _worker_ping() -> bool:
+    return _worker_service.nlp is not None
+
+class NLPPool:
+    """
+    Process pool for spaCy tagging, so CPU-bound NLP never holds the GIL of the API worker.
+    Each process loads the model once; callers get None on timeout/error and fall back to regex.
+    """
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queue_depth = 0 # tasks submitted and not finished yet
+        self.submitted = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.ready = False # True once a worker has answered a ping (its initializer has run)
+        self.model_loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self):
+        with self._lock:
+            if self._executor is not None or not self.enabled:
+                return
+            # spawn: the API process has threads (model loader, uvicorn), fork would copy their locks
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.SPACY_MODEL, settings.SPACY_EXCLUDE),
+            )
+        # Warm up: get every worker loading its model before the first request
+        for _ in range(self.workers):
+            self._submit(_worker_ping).add_done_callback(self._ping_done)
+        print(f"NLP POOL: Started {self.workers} worker process(es) for {settings.SPACY_MODEL}.")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self.ready = False
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self.queue_depth += 1
+            self.submitted += 1
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _ping_done(self, future):
+        # Any answer means the worker's initializer finished (model loaded or definitively missing)
+        if not future.cancelled() and future.exception() is None:
+            self.model_loaded = future.result()
+            self.ready = True
+
+    def _task_done(self, _future):
+        with self._lock:
+            self.queue_depth -= 1
+
+    async def analyze(self, texts: List[str]):
+        """Token lists for texts from a pool worker, or None (timeout / broken pool) -> regex mode."""
+        if self._executor is None:
+            self.start()
+        try:
+            future = self._submit(_worker_analyze, texts)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # The task keeps running in its worker; only this request gives up on it
+            self.timeouts += 1
+            print(f"NLP POOL: Timeout after {self.timeout}s (queue depth {self.queue_depth}). Using regex fallback.")
+        except BrokenProcessPool as e:
+            # A worker died (OOM...): drop the pool, the next request starts a fresh one
+            self.errors += 1
+            print(f"NLP POOL: Pool broken: {e}. Restarting on next request, using regex fallback.")
+            self.shutdown()
+        except Exception as e:
+            self.errors += 1
+            print(f"NLP POOL: Worker error: {e}. Using regex fallback.")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "ready": self.ready,
+            "model_loaded": self.model_loaded,
+            "queue_depth": self.queue_depth,
+            "submitted": self.submitted,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
+
+nlp_pool = NLPPool(settings.NLP_WORKERS, settings.NLP_TIMEOUT_SECONDS)
@@ -1,118 +1,340 @@
-import spacy
 import re
-from typing import List, Dict, Tuple, Optional
-from app.models.schemas import MovementProposal, ActionType, MaterialState, Interpretation
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, FrozenSet, NamedTuple
+from app.models.schemas import MovementProposal, ActionType, Interpretation
 from app.core.config import get_settings
+from app.core.metrics import NO_TIMER
+from app.services.nlp_pool import nlp_pool
+from app.services.material_gazetteer import MaterialGazetteer
+from starlette.concurrency import run_in_threadpool
 
 settings = get_settings()
 
+# Keyword lists by category, matched on whole words only ("ver" no longer fires inside "mover").
+KEYWORDS = {
+    "QUERY": ["donde", "dónde", "hay", "buscar", "encuentra", "tienes", "stock", "quedan", "ver", "listar", "dime",
+              "cual", "cuál", "que", "qué", "info", "detalle"],
+    # Strong match patterns (explicit phrases)
+    "STRONG_QUERY": ["dónde", "donde está", "donde esta", "donde hay", "hay un", "hay una",
+                     "en que", "en qué", "que hay", "qué hay", "cual es", "cuál es",
+                     "en que modulo", "en qué módulo", "en que estanteria", "en qué estantería"],
+    "GREETING": ["hola", "buenos días", "buenas tardes", "buenas noches", "hey", "saludos"],
+    "COURTESY": ["gracias", "adiós", "hasta luego", "chao", "genial", "perfecto", "vale"],
+    # Plurals listed explicitly ("entradas de ..."): whole-word matching doesn't see them inside the singular
+    "ENTRADA": ["llegado", "llegados", "entrada", "entradas", "alta", "altas", "nueva codigo"],
+    "SALIDA": ["salida", "salidas", "cliente", "clientes", "baja", "bajas"],
+    "MOVIMIENTO": ["movimiento", "movimientos", "cambio", "cambios", "mover", "mueve", "muevo", "trasladar", "traslada"], # verb forms cover regex-only mode
+    "ONE": ["un", "una", "uno"], # explicit word numbers -> quantity 1
+}
+# Verb lemmas (from spaCy) per action
+ENTRADA_VERBS = frozenset(["llegar", "entrar", "recibir", "ingresar", "registrar", "traer", "meter"])
+SALIDA_VERBS = frozenset(["sacar", "salir", "enviar", "despachar", "retirar", "llevar"])
+MOVIMIENTO_VERBS = frozenset(["mover", "trasladar", "cambiar", "reubicar", "pasar", "poner", "colocar", "dejar"])
+
+def _keyword_categories(keywords: Dict[str, List[str]]) -> Dict[str, FrozenSet[str]]:
+    """
+    keyword -> categories. The alternation consumes the longest phrase ("donde hay"), so a phrase
+    also carries the categories of the keywords inside it ("donde", "hay").
+    """
+    categories = {}
+    for category, words in keywords.items():
+        for w in words:
+            categories.setdefault(w, set()).add(category)
+    for phrase in categories:
+        words = phrase.split()
+        for word in words if len(words) > 1 else []:
+            categories[phrase] |= categories.get(word, set())
+    return {k: frozenset(v) for k, v in categories.items()}
+
+KEYWORD_CATEGORIES = _keyword_categories(KEYWORDS)
+# Location alternatives: named groups, the value is the whole match or the captured number
+LOCATION_PATTERNS = [
+    r"(?P<shelf>E\d+-M\d+-A\d+)",          # E1-M1-A1
+    r"(?P<pallet_id>P-\d+)",                 # P-01
+    r"(?P<zone>RECEPCION|EXTERNO|MUELLE)",
+    # Natural language mappings
+    r"palet\s*[-#]?\s*(?P<palet>\d+)",
+    r"estanter[ií]a?\s*(?P<estanteria>\d+)",
+]
+LOCATION_PREFIXES = {"palet": "P-", "estanteria": "E"}
+# Single precompiled scanner: locations first (they own their digits), then "del 7" / "al 9" after a pallet or
+# shelf ("del palet 2 al 5" -> P-2, P-5), then keywords (longest first), then numbers
+SCANNER = re.compile(
+    "|".join(LOCATION_PATTERNS)
+    + r"|\b(?:del|al)\s+(?P<bare>\d+)\b"
+    + r"|(?<!\w)(?P<kw>" + "|".join(re.escape(k) for k in sorted(KEYWORD_CATEGORIES, key=len, reverse=True)) + r")(?!\w)"
+    + r"|(?P<num>\b\d+\b)",
+    re.IGNORECASE,
+)
+# Where a compound command may continue with another movement ("... y 4 mesas del 7 al 9")
+CLAUSE_SPLIT = re.compile(r"\s+y\s+|\s*[,;]\s*", re.IGNORECASE)
+
+class TokenInfo(NamedTuple):
+    """The spaCy token attributes the extractors use; plain data, so it can cross process boundaries."""
+    idx: int
+    text: str
+    pos_: str
+    lemma_: str
+    like_num: bool
+
+class TextScan(NamedTuple):
+    location_spans: List[Tuple[int, int, str]] # (start, end, location_id) in text order
+    numbers: List[Tuple[int, int]] # (start, value) of digit quantities outside locations, in text order
+    keywords: FrozenSet[str] # keyword categories present in the text
+    ones: List[int] # start of each "un/una/uno"
+
+class ParseCache:
+    """
+    Bounded LRU of text -> Interpretation, capped by entry count and approximate bytes.
+    Entries are the text-only result of parse(); callers get deep copies, so per-request
+    enrichment (suggested locations, query answers) never leaks back into the cache.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Interpretation, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        """Whitespace and case normalized text."""
+        return " ".join(text.split()).lower()
+
+    def get(self, key: str) -> Optional[Interpretation]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0].model_copy(deep=True)
+
+    def put(self, key: str, interpretation: Interpretation):
+        size = len(key) + len(interpretation.model_dump_json())
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        stored = interpretation.model_copy(deep=True)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (stored, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
 class NLPService:
     def __init__(self):
+        # The model is loaded off the import path (see start_background_load);
+        # until then parse() runs in regex-only fallback mode.
+        self.nlp = None
+        self.ready = False # True once loading finished (model available or definitively missing)
+        self.load_seconds = None
+        self._load_thread = None
+        self.cache = ParseCache(settings.NLP_CACHE_SIZE, settings.NLP_CACHE_MAX_BYTES)
+        self.gazetteer = MaterialGazetteer() # material names known by the inventory
+
+    def load_model(self, model_name: Optional[str] = None, exclude: Optional[List[str]] = None):
+        """
+        Load the spaCy model (blocking). Safe to call from a background thread.
+        Only token.pos_, token.lemma_ and like_num are used, so components that do not feed
+        them (dependency parser, NER by default) are excluded from the pipeline.
+        """
+        model_name = model_name or settings.SPACY_MODEL
+        if exclude is None:
+            exclude = [c.strip() for c in settings.SPACY_EXCLUDE.split(",") if c.strip()]
+
+        start = time.perf_counter()
+        nlp = None
         try:
-            self.nlp = spacy.load("es_core_news_lg")
-            print("NLP: spaCy model loaded successfully.")
-        except OSError:
-            print("NLP: spaCy model not found. Running in regex-only fallback mode.")
-            self.nlp = None
-
-    def _extract_locations(self, text: str) -> List[str]:
-        """Extract warehouse locations using regex patterns."""
-        patterns = [
-            r"E\d+-M\d+-A\d+",  # E1-M1-A1
-            r"P-\d+",           # P-01
-            r"RECEPCION",
-            r"EXTERNO",
-            r"MUELLE",
-            # Natural language mappings
-            r"palet\s*[-#]?\s*(\d+)",
-            r"estanter[iía]\s*(\d+)",
-        ]
+            import spacy # heavy import, kept out of module import time
+            nlp = spacy.load(model_name, exclude=exclude)
+            print(f"NLP: spaCy model {model_name} loaded successfully. Pipeline: {nlp.pipe_names}")
+        except (OSError, ImportError):
+            print(f"NLP: spaCy model {model_name} not found. Running in regex-only fallback mode.")
+        self.load_seconds = round(time.perf_counter() - start, 3)
+        self.nlp = nlp
+        self.ready = True
+        self.cache.clear() # results depend on the model
+        print(f"NLP: Model loading finished in {self.load_seconds}s.")
+
+    def start_background_load(self):
+        """
+        Start loading the model in a daemon thread so the worker can answer right away.
+        With NLP_WORKERS > 0 the model lives in the pool processes instead and is not loaded here.
+        """
+        if nlp_pool.enabled:
+            nlp_pool.start()
+            return
+        if self.ready or self._load_thread is not None:
+            return
+        self._load_thread = threading.Thread(target=self.load_model, name="nlp-loader", daemon=True)
+        self._load_thread.start()
+
+    def status(self) -> dict:
+        return {
+            # With a pool the model lives in the worker processes, never in this one
+            "ready": nlp_pool.ready if nlp_pool.enabled else self.ready,
+            "model_loaded": nlp_pool.model_loaded if nlp_pool.enabled else self.nlp is not None,
+            "load_seconds": self.load_seconds,
+            "parse_cache": self.cache.stats(),
+            "pool": nlp_pool.stats(),
+        }
+
+    def _scan(self, text: str) -> TextScan:
+        """
+        One pass of the precompiled scanner over the text: locations, digit quantities and
+        keyword categories (intent words and "un/una/uno") come out of the same finditer.
+        """
+        location_spans, numbers, keywords, ones = [], [], set(), []
+        last_prefix = None # kind of the last pallet/shelf seen, for "del 7 al 9"
+        for match in SCANNER.finditer(text):
+            kind = match.lastgroup
+            if kind == "kw":
+                categories = KEYWORD_CATEGORIES[match.group(0).lower()]
+                keywords |= categories
+                if "ONE" in categories:
+                    ones.append(match.start())
+            elif kind == "num" or (kind == "bare" and last_prefix is None):
+                numbers.append((match.start(kind), int(match.group(kind))))
+            elif kind == "bare":
+                location_spans.append((match.start(kind), match.end(kind), f"{last_prefix}{match.group(kind)}".upper()))
+            else:
+                value = match.group(kind)
+                # "palet 17" -> "P-17", "estantería 2" -> "E2" (usually just the shelf ID)
+                loc = LOCATION_PREFIXES[kind] + value if kind in LOCATION_PREFIXES else value
+                location_spans.append((match.start(), match.end(), loc.upper()))
+                last_prefix = "P-" if kind in ("palet", "pallet_id") else "E" if kind == "estanteria" else None
+        return TextScan(location_spans, numbers, frozenset(keywords), ones)
+
+    def _split_clauses(self, text: str, scan: TextScan) -> List[Tuple[int, int]]:
+        """
+        (start, end) of each movement in a compound command: "mover 3 sillas del palet 2 al 5 y 4 mesas
+        del 7 al 9" -> two clauses. A piece only starts a new clause if it brings its own quantity or
+        location, so "sillas y mesas" or "balones, conos" stay one material phrase.
+        """
+        clauses = []
+        start = 0
+        for sep in CLAUSE_SPLIT.finditer(text):
+            piece_end = next((m.start() for m in CLAUSE_SPLIT.finditer(text, sep.end())), len(text))
+            if self._has_movement_data(scan, sep.end(), piece_end):
+                clauses.append((start, sep.start()))
+                start = sep.end()
+        clauses.append((start, len(text)))
+        return clauses
+
+    def _has_movement_data(self, scan: TextScan, start: int, end: int) -> bool:
+        return (any(start <= s < end for s, _ in scan.numbers)
+                or any(start <= s < end for s in scan.ones)
+                or any(start <= s < end for s, _, _ in scan.location_spans))
+
+    def _extract_locations(self, spans: List[Tuple[int, int, str]]) -> List[str]:
+        """Location IDs in the order they appear (origin before destination), deduplicated."""
         locations = []
-        for pat in patterns:
-            param_matches = re.finditer(pat, text, re.IGNORECASE)
-            for match in param_matches:
-                full_str = match.group(0)
-                
-                # Handle capture groups for "palet 17" -> "P-17"
-                if len(match.groups()) > 0 and match.group(1):
-                    val = match.group(1)
-                    if "palet" in full_str.lower():
-                        locations.append(f"P-{val}")
-                    elif "estanter" in full_str.lower():
-                        locations.append(f"E{val}") # Assuming E1, E2... usually just shelf ID. Refine if needed.
-                else:
-                    locations.append(full_str.upper())
-                    
-        return list(set([l.upper() for l in locations])) # Dedupe
-
-    def _extract_quantities(self, doc, text: str) -> List[int]:
-        """Extract numeric quantities from spaCy doc and text."""
+        for _, _, loc in spans:
+            if loc not in locations:
+                locations.append(loc)
+        return locations
+
+    def _in_spans(self, start: int, end: int, spans: List[Tuple[int, int, str]]) -> bool:
+        return any(start < s_end and end > s_start for s_start, s_end, _ in spans)
+
+    def _extract_quantities(self, doc, scan: TextScan, start: int = 0, end: Optional[int] = None) -> List[int]:
+        """
+        Extract numeric quantities in text order (within text[start:end]), ignoring numbers that
+        belong to a location ("palet 17").
+        """
+        end = end if end is not None else float("inf")
         quantities = []
-        
-        # 1. Explicit word numbers
-        text_lower = text.lower()
-        if re.search(r"\b(un|una|uno)\b", text_lower): # un, una, uno
-             quantities.append(1)
 
         if not doc:
-             # Fallback regex for digits
-             nums = re.findall(r"\b\d+\b", text)
-             return [int(n) for n in nums] + quantities
+             # Fallback: digits found by the scanner (location digits were consumed by their location)
+             quantities.extend(value for pos, value in scan.numbers if start <= pos < end)
+        else:
+            for token in doc:
+                if not start <= token.idx < end:
+                    continue
+                if token.like_num and not self._in_spans(token.idx, token.idx + len(token.text), scan.location_spans):
+                    try:
+                        quantities.append(int(token.text))
+                    except ValueError:
+                        # Word numbers (dos, tres...) are handled below only for "un/una/uno"
+                        pass
 
-        for token in doc:
-            if token.like_num:
-                try:
-                    val = int(token.text)
-                    quantities.append(val)
-                except ValueError:
-                    # Try to convert word to num if needed (uno, dos...) - spacy usually handles this somewhat
-                    if token.text.lower() in ["un", "una", "uno"]:
-                        quantities.append(1)
-                    pass
-        
-        return list(set(quantities))
+        # Explicit word numbers: "una caja" -> 1 (after digits, "una caja de 20" is 20)
+        if any(start <= pos < end for pos in scan.ones): # un, una, uno
+             quantities.append(1)
 
-    def _extract_materials(self, doc, text: str, locations: List[str]) -> List[str]:
-        """Extract material names using spaCy nouns and context, REMOVING detected locations first."""
-        
-        # Clean text of known locations to avoid "palet 17" being "material palet"
-        clean_text = text
-        # We need to re-find the raw strings for locations to remove them
-        # Simple approach: Remove the patterns we know
-        patterns_to_remove = [
-             r"E\d+-M\d+-A\d+", 
-             r"P-\d+", 
-             r"RECEPCION", r"EXTERNO", r"MUELLE",
-             r"palet\s*[-#]?\s*\d+",
-             r"estanter[iía]\s*\d+",
-             r"\bdep\b", r"\bde\b" # remove prepositions often linking items
-        ]
-        
-        for pat in patterns_to_remove:
-            clean_text = re.sub(pat, " ", clean_text, flags=re.IGNORECASE)
-            
-        # Also remove numbers that were identified as quantities? 
-        # Ideally yes, but let's stick to doc analysis on the CLEANED text
-        
-        doc_clean = self.nlp(clean_text) if self.nlp else None
-        
-        if not doc_clean:
-            return ["material"]
+        deduped = []
+        for q in quantities:
+            if q not in deduped:
+                deduped.append(q)
+        return deduped
+
+    def sync_materials(self, inventory_version: int, records: List[dict]):
+        """Keep the material gazetteer in line with the inventory (no-op for an already seen version)."""
+        self.gazetteer.sync(inventory_version, (r.get("MATERIAL") for r in records))
+
+    def _extract_materials(self, doc, text: str, location_spans: List[Tuple[int, int, str]],
+                           start: int = 0, end: Optional[int] = None) -> List[str]:
+        """
+        Extract material names within text[start:end]: stored inventory names first (gazetteer, works
+        in regex-only mode too), else spaCy nouns. Tokens covered by detected locations are masked
+        (so "palet 17" is never "material palet") on the same tagged tokens used for everything else.
+        """
+        known = self.gazetteer.find(text, location_spans, start, end)
+        if known:
+            return known
+
+        if not doc:
+            return [] # callers fall back to the generic "material"
         
+        end = end if end is not None else len(text)
         materials = []
-        # Look for nouns that could be materials
-        for token in doc_clean:
+        phrase = []
+        # Look for nouns that could be materials; "y" / commas separate materials ("sillas, mesas y conos")
+        for token in doc:
+            if not start <= token.idx < end:
+                continue
+            if token.pos_ in ("CCONJ", "PUNCT"):
+                if phrase:
+                    materials.append(" ".join(phrase))
+                phrase = []
+                continue
+            if self._in_spans(token.idx, token.idx + len(token.text), location_spans):
+                continue
             if token.pos_ in ["NOUN", "PROPN"] and token.text.lower() not in [
-                "recepcion", "muelle", "almacen", "entrada", "salida", "caja", "unidades", "unidad", "zona", "sitio", "lugar"
+                "recepcion", "muelle", "almacen", "entrada", "salida", "caja", "unidades", "unidad", "zona", "sitio", "lugar",
+                "de", "dep" # prepositions often linking items, sometimes mistagged
             ]:
-                materials.append(token.text)
+                phrase.append(token.text)
+        if phrase:
+            materials.append(" ".join(phrase))
         
-        # If we found materials, join them into a phrase
-        if materials:
-            return [" ".join(materials)]
-        
-        # Fallback if cleaning stripped everything
-        return ["material"]
+        # Empty if masking stripped everything
+        return list(dict.fromkeys(materials))
 
     def _extract_verbs(self, doc) -> List[str]:
         """Extract action verbs and their lemmas."""
@@ -124,51 +346,37 @@ class NLPService:
                 verbs.append(token.lemma_.lower())
         return verbs
 
-    def _detect_intent(self, text: str, verbs: List[str]) -> str:
-        """Detect intent using verb analysis and keywords."""
-        text_lower = text.lower()
-        print(f"NLP Analysis: Text='{text_lower}', Verbs={verbs}")
+    def _detect_intent(self, text: str, keywords: FrozenSet[str], verbs: List[str]) -> str:
+        """Detect intent using verb analysis and the keyword categories found by _scan."""
+        print(f"NLP Analysis: Text='{text.lower()}', Verbs={verbs}, Keywords={sorted(keywords)}")
         
         # Check for inventory queries - PRIORITY
-        query_words = ["donde", "dónde", "hay", "buscar", "encuentra", "tienes", "stock", "quedan", "ver", "listar", "dime", "cual", "cuál", "que", "qué", "info", "detalle"]
-        is_query = any(w in text_lower for w in query_words)
-        
-        # Strong match patterns (Question marks or explicit phrases)
-        strong_patterns = [
-            "dónde", "donde está", "donde esta", "donde hay", "hay un", "hay una",
-            "en que", "en qué", "que hay", "qué hay", "cual es", "cuál es",
-            "en que modulo", "en qué módulo", "en que estanteria", "en qué estantería"
-        ]
+        is_query = "QUERY" in keywords
         
         # Check for greetings (if not a query)
-        greetings = ["hola", "buenos días", "buenas tardes", "buenas noches", "hey", "saludos"]
-        if any(g in text_lower for g in greetings) and not is_query:
+        if "GREETING" in keywords and not is_query:
             return "GREETING"
         
         # Check for thanks/goodbye
-        if any(w in text_lower for w in ["gracias", "adiós", "hasta luego", "chao", "genial", "perfecto", "vale"]):
+        if "COURTESY" in keywords:
             return "COURTESY"
 
         # Analyze verbs for warehouse actions - PRIORITY OVER QUERIES
         # "Me ha llegado X, donde lo pongo?" should be ENTRADA, not QUERY.
-        entrada_verbs = ["llegar", "entrar", "recibir", "ingresar", "registrar", "traer", "meter"]
-        salida_verbs = ["sacar", "salir", "enviar", "despachar", "retirar", "llevar"]
-        movimiento_verbs = ["mover", "trasladar", "cambiar", "reubicar", "pasar", "poner", "colocar", "dejar"]
-        
-        if any(v in verbs for v in entrada_verbs) or any(w in text_lower for w in ["llegado", "entrada", "alta", "nueva codigo"]):
+        if any(v in ENTRADA_VERBS for v in verbs) or "ENTRADA" in keywords:
              # Explicit override: "Quiero colocar..." is usually movement, but "Ha llegado... y quiero colocar" is Entry.
              # If "llegado" is present, it's likely an Entry.
              return "ENTRADA"
             
-        if any(v in verbs for v in salida_verbs) or any(w in text_lower for w in ["salida", "cliente", "baja"]):
+        if any(v in SALIDA_VERBS for v in verbs) or "SALIDA" in keywords:
             return "SALIDA"
             
-        if any(v in verbs for v in movimiento_verbs) or any(w in text_lower for w in ["movimiento", "cambio"]):
+        if any(v in MOVIMIENTO_VERBS for v in verbs) or "MOVIMIENTO" in keywords:
             return "MOVIMIENTO"
 
         # Strong match patterns for Queries (Question marks or explicit phrases)
         # Only check this AFTER actions to prevent "Donde lo ubico?" from masking the action intent.
-        if "?" in text or any(p in text_lower for p in strong_patterns):
+        if "?" in text or "STRONG_QUERY" in keywords:
             # Exception: "Quiero saber donde esta..." -> Query
             # But "Ponlo donde hay sitio" -> Movement (complex).
             # Assume Query for now if strong match.
@@ -188,9 +396,21 @@ class NLPService:
         intent: str, 
         quantities: List[int], 
         materials: List[str], 
-        locations: List[str]
+        locations: List[str],
+        default_origin: Optional[str] = None
     ) -> List[MovementProposal]:
-        """Build movement proposals based on extracted entities."""
+        """
+        Build movement proposals based on extracted entities: one per material ("sillas, mesas y
+        conos del palet 2 al 3" -> three), the i-th quantity going with the i-th material.
+        default_origin is used for a MOVIMIENTO with only a destination ("... y al 7").
+        """
+        if intent != "QUERY" and len(materials) > 1:
+            return [
+                movement
+                for i, material in enumerate(materials)
+                for movement in self._build_movements(
+                    intent, quantities[i:i + 1] or quantities[:1], [material], locations, default_origin)
+            ]
         movements = []
         
         # Default Logic
@@ -215,7 +435,9 @@ class NLPService:
         elif len(locations) == 1:
             if intent == "ENTRADA": found_target_loc = locations[0]
             elif intent == "SALIDA": found_source_loc = locations[0]
-            elif intent == "MOVIMIENTO": found_target_loc = locations[0] # "Mover a X"
+            elif intent == "MOVIMIENTO":
+                found_target_loc = locations[0] # "Mover a X"
+                found_source_loc = default_origin
         
         if intent == "QUERY":
              movements.append(MovementProposal(
@@ -280,35 +502,129 @@ class NLPService:
         if not movements:
             return f"He detectado una intención de {intent}, pero no pude extraer los detalles necesarios."
         
-        mov = movements[0]
+        if len(movements) > 1 and intent in ("ENTRADA", "SALIDA", "MOVIMIENTO"):
+            steps = "; ".join(self._describe_movement(intent, mov) for mov in movements)
+            return f"{len(movements)} movimientos: {steps}"
+
+        return self._describe_movement(intent, movements[0]) or f"Operación de {intent} detectada con {len(movements)} movimiento(s)"
+
+    def _describe_movement(self, intent: str, mov: MovementProposal) -> Optional[str]:
         if intent == "ENTRADA":
             return f"Registrar entrada de {mov.qty} unidad(es) de '{mov.item}' en {mov.destination}"
         elif intent == "SALIDA":
             return f"Registrar salida de {mov.qty} unidad(es) de '{mov.item}' desde {mov.origin}"
         elif intent == "MOVIMIENTO":
             return f"Mover {mov.qty} unidad(es) de '{mov.item}' desde {mov.origin} hasta {mov.destination}"
-        
-        return f"Operación de {intent} detectada con {len(movements)} movimiento(s)"
+        return None
+
+    def analyze(self, texts: List[str], batch_size: Optional[int] = None,
+                n_process: int = 1) -> List[Optional[List[TokenInfo]]]:
+        """
+        spaCy tagging only (the CPU-heavy part): texts -> plain token tuples, None per text in
+        regex-only mode. Picklable, so it is also what the NLP process pool workers return.
+        """
+        if not self.nlp:
+            return [None] * len(texts)
+        if len(texts) == 1:
+            docs = [self.nlp(texts[0])]
+        else:
+            docs = self.nlp.pipe(texts, batch_size=batch_size or settings.NLP_BATCH_SIZE, n_process=n_process)
+        return [
+            [TokenInfo(t.idx, t.text, t.pos_, t.lemma_, t.like_num) for t in doc]
+            for doc in docs
+        ]
 
-    def parse(self, text: str, user_id: str) -> Interpretation:
+    def parse(self, text: str, user_id: str, timer=NO_TIMER) -> Interpretation:
         """Parse user input and extract structured information."""
-        # 1. NLP Processing with spaCy
-        doc = self.nlp(text) if self.nlp else None
-        
-        # 2. Entity Extraction
-        locations = self._extract_locations(text)
-        quantities = self._extract_quantities(doc, text)
-        materials = self._extract_materials(doc, text, locations)
-        verbs = self._extract_verbs(doc)
+        return self.parse_many([text], user_id, timer=timer)[0]
+
+    def parse_many(self, texts: List[str], user_id: str, batch_size: Optional[int] = None,
+                   n_process: Optional[int] = None, timer=NO_TIMER) -> List[Interpretation]:
+        """Parse several commands at once, tagging them with nlp.pipe (one Interpretation per text)."""
+        results, missing = self._cached(texts)
+        if missing:
+            # 1. NLP Processing with spaCy (single pass, every extractor works on these tokens)
+            with timer.stage("tokenize"):
+                token_lists = self.analyze([texts[i] for i in missing], batch_size, n_process or settings.NLP_N_PROCESS)
+            # Regex-only results from the startup window must not outlive it
+            self._complete(texts, results, missing, token_lists, cache=self.ready, timer=timer)
+        return results
+
+    async def parse_async(self, text: str, user_id: str, timer=NO_TIMER) -> Interpretation:
+        """parse() for async endpoints: tagging runs off the event loop."""
+        return (await self.parse_many_async([text], user_id, timer))[0]
+
+    async def parse_many_async(self, texts: List[str], user_id: str, timer=NO_TIMER) -> List[Interpretation]:
+        """
+        parse_many() for async endpoints. Cache hits are answered right away; tagging goes to
+        the NLP process pool when NLP_WORKERS > 0 (regex fallback on timeout), else to a thread.
+        """
+        if not nlp_pool.enabled:
+            return await run_in_threadpool(self.parse_many, texts, user_id, None, None, timer)
+
+        results, missing = self._cached(texts, always=True)
+        if missing:
+            with timer.stage("tokenize"): # includes the wait in the pool queue
+                token_lists = await nlp_pool.analyze([texts[i] for i in missing])
+            timed_out = token_lists is None
+            if timed_out:
+                token_lists = [None] * len(missing)
+            self._complete(texts, results, missing, token_lists, cache=not timed_out, timer=timer)
+        return results
+
+    def _cached(self, texts: List[str], always: bool = False) -> Tuple[List[Optional[Interpretation]], List[int]]:
+        """Cached results (None where missing) and the indexes still to parse."""
+        if not (self.ready or always):
+            return [None] * len(texts), list(range(len(texts)))
+        results = [self.cache.get(self._cache_key(text)) for text in texts]
+        return results, [i for i, r in enumerate(results) if r is None]
+
+    def _cache_key(self, text: str) -> str:
+        # Results depend on the known material names too
+        return f"{self.gazetteer.version}|{ParseCache.key(text)}"
+
+    def _complete(self, texts, results, missing, token_lists, cache: bool, timer=NO_TIMER):
+        for i, tokens in zip(missing, token_lists):
+            results[i] = self._interpret(texts[i], tokens, timer)
+            # A missing model in a pool worker also yields None: only tagged results are cached
+            if cache and (tokens is not None or not nlp_pool.enabled):
+                self.cache.put(self._cache_key(texts[i]), results[i])
+
+    def _interpret(self, text: str, doc: Optional[List[TokenInfo]], timer=NO_TIMER) -> Interpretation:
+        """Everything after tagging (cheap, main process): entities, intent, movements and summary."""
+        # 2. Entity Extraction (one scanner pass over the text: locations, digits and keywords)
+        with timer.stage("locations"):
+            scan = self._scan(text)
+            locations = self._extract_locations(scan.location_spans)
         
         # 3. Intent Detection
-        intent = self._detect_intent(text, verbs)
+        with timer.stage("intent"):
+            verbs = self._extract_verbs(doc)
+            intent = self._detect_intent(text, scan.keywords, verbs)
         
-        # 4. Build Movement Proposals
-        movements = self._build_movements(intent, quantities, materials, locations)
+        # 4. Build Movement Proposals (one per clause of a compound command)
+        with timer.stage("build"):
+            clauses = self._split_clauses(text, scan) if intent in ("ENTRADA", "SALIDA", "MOVIMIENTO") else [(0, len(text))]
+        movements = []
+        previous = [] # movements of the previous clause, for elliptical ones ("... y al 7", "... y luego 5 al palet 4")
+        for start, end in clauses:
+            # A clause without its own locations shares the command's ("3 sillas y 4 mesas del palet 2 al 5")
+            clause_locations = self._extract_locations([s for s in scan.location_spans if start <= s[0] < end])
+            with timer.stage("quantities"):
+                quantities = self._extract_quantities(doc, scan, start, end)
+            with timer.stage("materials"):
+                materials = self._extract_materials(doc, text, scan.location_spans, start, end)
+            with timer.stage("build"):
+                if previous and not materials:
+                    materials = list(dict.fromkeys(m.item for m in previous))
+                    quantities = quantities or [previous[0].qty]
+                default_origin = previous[-1].origin if previous and previous[-1].origin not in ("EXTERNO", "RECEPCION") else None
+                previous = self._build_movements(intent, quantities, materials, clause_locations or locations, default_origin)
+                movements += previous
         
         # 5. Generate Summary
-        summary = self._generate_summary(intent, movements)
+        with timer.stage("build"):
+            summary = self._generate_summary(intent, movements)
         
         return Interpretation(
             intent=intent,
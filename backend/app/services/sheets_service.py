@@ -1,14 +1,26 @@
 import gspread
+import bisect
+import copy
 import json
+import re
 from typing import Any
 import uuid
 import datetime
+import threading
+import time
+import os
+import hashlib
+import mmap
+import tempfile
+import orjson
 from google.oauth2.service_account import Credentials
 from app.core.config import get_settings
-from app.models.schemas import MovementProposal, ActionType
+from app.services.inventory_schema import detect_inventory_schema
 
 settings = get_settings()
 
+SNAPSHOT_MAGIC = b"ALMSNAP2" # + orjson document (never pickle: the file lives in a shared temp dir)
+
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive"
@@ -21,6 +33,36 @@ class SheetService:
         # CODE SUPREMACY: Use static mirror instead of Sheet 'UBICACIONES'
         from app.core.static_data import VALID_LOCATIONS
         self._valid_locations = VALID_LOCATIONS
+        self._canonical_locations = None
+
+        # In-memory replica of INVENTARIO (raw cell values).
+        # The version is bumped whenever the content changes so that derived
+        # data (parsed records, serialized responses...) can be cached per version.
+        self._inventory_lock = threading.RLock()
+        self._inventory_write_lock = threading.Lock()
+        self._inventory_values = None
+        self._inventory_records = None
+        self._inventory_records_version = -1
+        self._inventory_version = 0
+        self._inventory_schema_cache = None
+        self._inventory_fetched_at = 0
+        self.INVENTORY_CACHE_TTL = settings.INVENTORY_CACHE_TTL
+
+        # Last known USUARIOS records and Config layout, persisted in the on-disk snapshot
+        self._users_records = None
+        self._layout_json = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_digest = None # sha256 of the last content written / loaded
+        self.snapshot_stale = False
+
+        # Index of PENDING_ACTIONS: id -> {"row", "values", "payload"}, kept in sheet order and
+        # maintained on add/mark/delete. Rows only move when processed ones are archived; the index
+        # is reloaded after PENDING_CACHE_TTL to pick up other workers' writes.
+        self._pending_lock = threading.RLock()
+        self._pending_headers = None
+        self._pending_index = None
+        self._pending_loaded_at = 0
+        self.PENDING_CACHE_TTL = settings.PENDING_CACHE_TTL
 
     def connect(self):
         if self.client:
@@ -71,6 +113,13 @@ class SheetService:
         if not loc_id: return False
         return loc_id in self._valid_locations
 
+    def resolve_location(self, loc_id: str):
+        """Canonical location ID for user input ('e4a-m1-a1 ' -> 'E4a-M1-A1'), or None if unknown."""
+        if not loc_id: return None
+        if self._canonical_locations is None:
+            self._canonical_locations = {l.upper(): l for l in self._valid_locations}
+        return self._canonical_locations.get(str(loc_id).strip().upper())
+
     def execute_transaction(self, action_type: str, payload: Any, user_id: str, transaction_id: str):
         if not self.client:
             self.connect()
@@ -114,6 +163,8 @@ class SheetService:
                 # Write back
                 new_json_str = json.dumps(state)
                 ws_config.update('B1', new_json_str) # update_acell or update
+                self._layout_json = new_json_str
+                self.save_snapshot()
             else:
                  print(f"SHEETS ERROR: Location {target_id} not found in state.")
         
@@ -123,67 +174,121 @@ class SheetService:
 
 
     def _execute_movement_transaction(self, movements: list[Any], user_id: str, transaction_id: str):
+        # Serialize INVENTARIO read-modify-write cycles (transactions, compaction) within this process
+        with self._inventory_write_lock:
+            self._apply_movements(movements, user_id, transaction_id)
+
+    def execute_movement_batches(self, batches: list[tuple]):
+        """Several MOVEMENT transactions [(movements, user_id, transaction_id)] committed together."""
+        if not self.client:
+            self.connect()
+        with self._inventory_write_lock:
+            self._apply_movement_batches(batches)
+
+    def _apply_movements(self, movements: list[Any], user_id: str, transaction_id: str):
+        self._apply_movement_batches([(movements, user_id, transaction_id)])
+
+    def _apply_movement_batches(self, batches: list[tuple]):
+        """
+        Apply (movements, user_id, transaction_id) batches in order against a single INVENTARIO
+        read, with one INVENTARIO write and then one HISTORIAL append for all of them
+        (history only records movements that reached INVENTARIO).
+        """
         try:
             ws_inv = self.doc.worksheet("INVENTARIO")
             ws_hist = self.doc.worksheet("HISTORIAL")
             
-            # 1. Append to HISTORIAL
+            # 1. HISTORIAL rows, appended once INVENTARIO is written
             # Cols: TIMESTAMP | USUARIO | ACCION | MATERIAL | CANTIDAD | ORIGEN | DESTINO | MOTIVO
             timestamp = datetime.datetime.utcnow().isoformat()
             history_rows = []
             
-            for mov in movements:
-                # Handle dictionary or object
-                m_type = mov.get('type') if isinstance(mov, dict) else mov.type.value
-                m_item = mov.get('item') if isinstance(mov, dict) else mov.item
-                m_qty = mov.get('qty') if isinstance(mov, dict) else mov.qty
-                m_origin = mov.get('origin') if isinstance(mov, dict) else mov.origin
-                m_dest = mov.get('destination') if isinstance(mov, dict) else mov.destination
-                m_reason = mov.get('reason', "") if isinstance(mov, dict) else (mov.reason or "")
-
-                history_rows.append([
-                    timestamp,
-                    user_id,
-                    m_type,
-                    m_item,
-                    m_qty,
-                    m_origin,
-                    m_dest,
-                    m_reason
-                ])
-            
-            # Batch append history
-            ws_hist.append_rows(history_rows)
-            
+            for movements, user_id, _ in batches:
+                for mov in movements:
+                    # Handle dictionary or object
+                    m_type = mov.get('type') if isinstance(mov, dict) else mov.type.value
+                    m_item = mov.get('item') if isinstance(mov, dict) else mov.item
+                    m_qty = mov.get('qty') if isinstance(mov, dict) else mov.qty
+                    m_origin = mov.get('origin') if isinstance(mov, dict) else mov.origin
+                    m_dest = mov.get('destination') if isinstance(mov, dict) else mov.destination
+                    m_reason = mov.get('reason', "") if isinstance(mov, dict) else (mov.reason or "")
+
+                    history_rows.append([
+                        timestamp,
+                        user_id,
+                        m_type,
+                        m_item,
+                        m_qty,
+                        m_origin,
+                        m_dest,
+                        m_reason
+                    ])
+
             # 2. Update INVENTARIO
             # This is complex in Sheets. Easiest robust way for Phase 1:
             # Fetch all inventory, process in memory, rewrite or update cells.
             # Ideally: Read all -> Dict{(Loc, Item): RowIndex} -> Update/Append
             
-            # Fetch all data (heavy but safe)
-            all_inv = ws_inv.get_all_values()
-            headers = all_inv[0] # ID_LUGAR, MATERIAL, CANTIDAD, ...
-            
-            # Map indices
+            # Plan against a fresh read; rows are re-checked right before writing, since another
+            # process (e.g. a compaction) may have moved or changed them since the read
+            for attempt in range(3):
+                plan = self._plan_inventory_writes(ws_inv, batches)
+                if plan is None:
+                    raise Exception("INVENTARIO headers mismatch, nothing was written.")
+                all_inv, updates, rows_to_append, originals = plan
+                if self._inventory_rows_unchanged(ws_inv, originals):
+                    break
+                print(f"SHEETS: INVENTARIO rows changed during the transaction, re-reading (attempt {attempt + 1}).")
+            else:
+                raise Exception("INVENTARIO kept changing during the transaction, no inventory cell was written.")
+
+            # Execute Writes
+            if updates:
+                ws_inv.update_cells(updates)
+            if rows_to_append:
+                ws_inv.append_rows(rows_to_append)
+
+            # Keep the replica in sync with what we just wrote (no extra read)
+            self._store_inventory_values(all_inv + [[str(c) for c in r] for r in rows_to_append])
+            self.save_snapshot()
+
+            # 3. Batch append history. INVENTARIO is already committed: a failure here must not
+            # make the caller retry (and apply the movements twice), so it is only reported
             try:
-                idx_loc = headers.index("ID_LUGAR")
-                idx_mat = headers.index("MATERIAL")
-                idx_qty = headers.index("CANTIDAD")
-            except ValueError:
-                print(f"SHEETS ERROR: Inventory headers mismatch. Found headers: {headers}")
-                return
+                ws_hist.append_rows(history_rows)
+            except Exception as e:
+                print(f"SHEETS ERROR: INVENTARIO updated but HISTORIAL append failed, {len(history_rows)} rows missing: {history_rows}. {e}")
+                
+        except Exception as e:
+            print(f"SHEETS TRANSACTION ERROR: {e}")
+            raise e
 
-            # Build index map: (Loc, Material) -> Row Number (0-based in array, 1-based in sheet)
-            inv_map = {}
-            for i, row in enumerate(all_inv[1:], start=2): # Start 2 matches sheet row num
-                if len(row) > idx_qty:
-                    key = (row[idx_loc], row[idx_mat])
-                    inv_map[key] = i
-            
-            # Process movements
-            updates = [] # List of Cell objects
-            rows_to_append = []
-            
+
+
+    def _plan_inventory_writes(self, ws_inv, batches: list[tuple]):
+        """Read INVENTARIO and work out the cell updates / new rows for the batches (None if unusable)."""
+        # Fetch all data (heavy but safe)
+        all_inv = ws_inv.get_all_values()
+        schema = self._inventory_schema(all_inv)
+        if not schema or not schema.writable:
+            print(f"SHEETS ERROR: Inventory headers mismatch. Found headers: {schema.headers if schema else all_inv[:1]}")
+            return None
+        idx_qty = schema.idx_qty
+
+        # Build index map: (Loc, Material) -> Row Number (0-based in array, 1-based in sheet)
+        inv_map = {}
+        for i, row in enumerate(all_inv[schema.data_start:], start=schema.data_start + 1): # matches sheet row num
+            if len(row) > idx_qty:
+                key = (schema.location_key(row), row[schema.idx_material])
+                inv_map[key] = i
+        
+        # Process movements
+        updates = [] # List of Cell objects
+        originals = {} # row number -> row as read, to check nobody moved or changed it before writing
+        rows_to_append = []
+        new_rows = {} # (Loc, Material) -> index in rows_to_append, so repeated keys accumulate
+        
+        for movements, user_id, _ in batches:
             for mov in movements:
                 # Handle dictionary or object
                 m_item = mov.get('item') if isinstance(mov, dict) else mov.item
@@ -194,80 +299,67 @@ class SheetService:
 
                 # DESTINATION Logic
                 if m_dest and m_dest != "EXTERNO":
-                    key = (m_dest, m_item)
+                    key = (m_dest.upper(), m_item)
                     if key in inv_map:
                         # Update existing
                         row_num = inv_map[key]
-                        current_qty = int(all_inv[row_num-1][idx_qty])
+                        current_qty = schema.quantity(all_inv[row_num-1]) or 0
                         new_qty = current_qty + m_qty
-                        
+                    
+                        originals.setdefault(row_num, list(all_inv[row_num-1]))
                         all_inv[row_num-1][idx_qty] = str(new_qty)
-                        
+                    
                         updates.append(gspread.Cell(row_num, idx_qty+1, new_qty))
+                    elif key in new_rows:
+                        # Already being created in this same transaction
+                        rows_to_append[new_rows[key]][idx_qty] += m_qty
                     else:
-                        # Headers: ['ID_REGISTRO', 'TIPO_UBICACION', 'ID_LUGAR', 'MODULO', 'ALTURA', 'TIPO_ITEM', 'MATERIAL', 'CANTIDAD', 'LOTE', 'ESTADO', 'RESPONSABLE', 'OBSERVACIONES', '', '', '', '', '', '', '', '']
-                        # Calculate a simple ID_REGISTRO based on row count
-                        next_id = len(all_inv) + len(rows_to_append)
-                        
                         m_program = mov.get('program', '') if isinstance(mov, dict) else getattr(mov, 'program', '')
                         raw_item_type = mov.get('item_type', 'Caja') if isinstance(mov, dict) else getattr(mov, 'item_type', 'Caja')
                         m_item_type = "Suelto" if raw_item_type == "MATERIAL" else "Caja"
-                        
-                        # Determine if it's a shelf location (starts with 'E')
-                        is_shelf = m_dest.startswith('E')
-                        tipo_ubicacion = "Estantería" if is_shelf else "Palet"
-                        
-                        # Extract Modulo and Altura if it's a shelf (e.g. E1-M1-A2)
-                        modulo = ""
-                        altura = ""
-                        id_lugar = m_dest
-                        
-                        if is_shelf:
-                            parts = m_dest.split('-')
-                            id_lugar = parts[0].replace('E', '') if len(parts) > 0 else m_dest
-                            modulo = parts[1].replace('M', '') if len(parts) > 1 else ""
-                            altura = parts[2].replace('A', '') if len(parts) > 2 else ""
-                        else:
-                            # For pallets, ID_REGISTRO should be the pallet ID (ID_LUGAR) according to user
-                            pass
-
-                        rows_to_append.append([
-                            m_dest,         # ID_REGISTRO (User requested this to be where it's located, e.g. pallet ID or full location string)
-                            tipo_ubicacion, # TIPO_UBICACION 
-                            id_lugar,       # ID_LUGAR
-                            modulo,         # MODULO
-                            altura,         # ALTURA
-                            m_item_type,    # TIPO_ITEM
-                            m_item,         # MATERIAL
-                            m_qty,          # CANTIDAD
-                            m_program,      # LOTE (Program goes here based on user confirmation)
-                            m_state,        # ESTADO (Default STOCK or the provided state)
-                            user_id,        # RESPONSABLE
-                            ""              # OBSERVACIONES
-                        ])
-                
+
+                        rows_to_append.append(schema.new_row(
+                            location=m_dest,
+                            material=m_item,
+                            qty=m_qty,
+                            lote=m_program,
+                            state=m_state, # Default STOCK or the provided state
+                            responsible=user_id,
+                            item_type=m_item_type
+                        ))
+                        new_rows[key] = len(rows_to_append) - 1
+            
                 # ORIGIN Logic (Deduct)
                 if m_origin and m_origin != "EXTERNO":
-                    key = (m_origin, m_item)
+                    key = (m_origin.upper(), m_item)
                     if key in inv_map:
                         row_num = inv_map[key]
-                        current_qty = int(all_inv[row_num-1][idx_qty])
+                        current_qty = schema.quantity(all_inv[row_num-1]) or 0
                         new_qty = max(0, current_qty - m_qty)
-                        
+                    
+                        originals.setdefault(row_num, list(all_inv[row_num-1]))
                         all_inv[row_num-1][idx_qty] = str(new_qty)
                         updates.append(gspread.Cell(row_num, idx_qty+1, new_qty))
-            
-            # Execute Writes
-            if updates:
-                ws_inv.update_cells(updates)
-            if rows_to_append:
-                ws_inv.append_rows(rows_to_append)
-                
-        except Exception as e:
-            print(f"SHEETS TRANSACTION ERROR: {e}")
-            raise e
+                    elif key in new_rows:
+                        pending_row = rows_to_append[new_rows[key]]
+                        pending_row[idx_qty] = max(0, pending_row[idx_qty] - m_qty)
 
+        return all_inv, updates, rows_to_append, originals
 
+    def _inventory_rows_unchanged(self, ws_inv, originals: dict) -> bool:
+        """One read of the rows about to be updated: True if each still holds what was planned against."""
+        if not originals:
+            return True
+        rows = sorted(originals)
+        fresh = ws_inv.batch_get([f"{r}:{r}" for r in rows])
+        for row_num, values in zip(rows, fresh):
+            current = [str(c) for c in (values[0] if values else [])]
+            expected = [str(c) for c in originals[row_num]]
+            while expected and expected[-1] == "":
+                expected.pop()
+            if current != expected:
+                return False
+        return True
 
     def get_users(self) -> list[dict]:
         """Fetch all users from USUARIOS tab."""
@@ -281,6 +373,8 @@ class SheetService:
             for r in records:
                 if 'ROLE' in r and isinstance(r['ROLE'], str):
                     r['ROLE'] = r['ROLE'].upper()
+            self._users_records = [dict(r) for r in records]
+            self.save_snapshot()
             return records
         except Exception as e:
             print(f"SHEETS ERROR: Could not fetch users. {e}")
@@ -303,6 +397,37 @@ class SheetService:
             print(f"SHEETS ERROR: Could not add user. {e}")
             raise e
 
+    def update_user_passwords(self, passwords: dict) -> int:
+        """
+        Write several PASSWORD cells of USUARIOS in one batch. passwords maps email -> (old, new);
+        a cell that no longer holds `old` (edited meanwhile) is left alone. Returns cells written.
+        """
+        if not self.client:
+            self.connect()
+        ws = self.doc.worksheet("USUARIOS")
+        values = ws.get_all_values()
+        if not values:
+            return 0
+        headers = [str(h).strip().upper() for h in values[0]]
+        idx_email = next((headers.index(h) for h in ["USER_ID", "USER ID", "ID", "EMAIL"] if h in headers), -1)
+        if idx_email == -1 or "PASSWORD" not in headers:
+            raise Exception(f"USUARIOS headers mismatch, can't write passwords. Found headers: {headers}")
+        idx_pwd = headers.index("PASSWORD")
+
+        wanted = {str(email).strip().lower(): change for email, change in passwords.items()}
+        updates = []
+        for row_num, row in enumerate(values[1:], start=2):
+            email = str(row[idx_email] if idx_email < len(row) else "").strip().lower()
+            change = wanted.pop(email, None) # first row wins, as in the users cache
+            if change is None:
+                continue
+            current = row[idx_pwd] if idx_pwd < len(row) else ""
+            if str(current).strip() == str(change[0]).strip():
+                updates.append(gspread.Cell(row_num, idx_pwd + 1, change[1]))
+        if updates:
+            ws.update_cells(updates)
+        return len(updates)
+
     def update_user_role(self, email: str, new_role: str):
         if not self.client:
             self.connect()
@@ -345,145 +470,287 @@ class SheetService:
                 payload_json,
                 "PENDING"
             ]
-            ws.append_row(row)
+            response = ws.append_row(row)
+
+            # The append response tells where the row landed: index it without re-reading the tab
+            with self._pending_lock:
+                if self._pending_index is not None:
+                    match = re.search(r"![A-Z]+(\d+)", str((response or {}).get("updates", {}).get("updatedRange", "")))
+                    if match:
+                        self._pending_index[action_id] = self._pending_entry(int(match.group(1)), row)
+                    else:
+                        self._pending_index = None # unknown row, reload on next access
             return action_id
         except Exception as e:
              print(f"SHEETS ERROR: Could not add pending action. {e}")
              raise e
 
-    def get_pending_actions(self) -> list[dict]:
-        if not self.client:
-            self.connect()
+    def _pending_entry(self, row_num: int, values: list) -> dict:
+        values = [str(v) for v in values]
         try:
-            ws = self.doc.worksheet("PENDING_ACTIONS")
-            return ws.get_all_records()
+            payload = json.loads(values[4]) if len(values) > 4 else None
+        except ValueError:
+            payload = None
+        return {"row": row_num, "values": values, "payload": payload}
+
+    def _pending_entries(self, force: bool = False) -> dict:
+        """The PENDING_ACTIONS index, loaded with a single read when missing or expired."""
+        with self._pending_lock:
+            expired = (time.time() - self._pending_loaded_at) > self.PENDING_CACHE_TTL
+            if self._pending_index is None or expired or force:
+                if not self.client:
+                    self.connect()
+                all_values = self.doc.worksheet("PENDING_ACTIONS").get_all_values()
+                self._pending_headers = all_values[0] if all_values else []
+                index = {}
+                for row_num, values in enumerate(all_values[1:], start=2):
+                    if values and values[0] and values[0] not in index:
+                        index[values[0]] = self._pending_entry(row_num, values)
+                self._pending_index = index
+                self._pending_loaded_at = time.time()
+            return self._pending_index
+
+    def get_pending_actions(self, include_processed: bool = False) -> list[dict]:
+        """PENDING_ACTIONS rows still waiting for an admin (all rows with include_processed)."""
+        try:
+            with self._pending_lock:
+                entries = self._pending_entries()
+                headers = self._pending_headers
+                return [
+                    dict(zip(headers, entry["values"] + [""] * (len(headers) - len(entry["values"]))))
+                    for entry in entries.values()
+                    if include_processed or not self._pending_processed(entry)
+                ]
         except Exception as e:
             print(f"SHEETS ERROR: Could not get pending actions. {e}")
             return []
 
-    def delete_pending_action(self, action_id: str):
+    @staticmethod
+    def _pending_processed(entry: dict) -> bool:
+        values = entry["values"]
+        return len(values) > 5 and values[5] not in ("", "PENDING")
+
+    def mark_pending_actions(self, action_ids: list[str], status: str) -> int:
+        """
+        Record the outcome (APPROVED / REJECTED) in the STATUS column: one update_cells call,
+        no row moves. Processed rows are archived later by compact_pending_actions().
+        """
         if not self.client:
             self.connect()
         try:
-            ws = self.doc.worksheet("PENDING_ACTIONS")
-            cell = ws.find(action_id)
-            if cell:
-                ws.delete_rows(cell.row)
+            with self._pending_lock:
+                ws = self.doc.worksheet("PENDING_ACTIONS")
+                marked = self._verified_pending_entries(ws, action_ids)
+                if not marked:
+                    return 0
+                ws.update_cells([gspread.Cell(entry["row"], 6, status) for entry in marked])
+                for entry in marked:
+                    entry["values"] += [""] * (6 - len(entry["values"]))
+                    entry["values"][5] = status
+                return len(marked)
         except Exception as e:
-            print(f"SHEETS ERROR: Could not delete pending action. {e}")
+            print(f"SHEETS ERROR: Could not update pending actions. {e}")
             raise e
-            
-    def get_pending_action(self, action_id: str) -> dict:
+
+    def _verified_pending_entries(self, ws, action_ids: list[str]) -> list[dict]:
+        """
+        Index entries of action_ids whose cached row still holds that ID (one read of column A
+        at those rows). Another process's compaction shifts rows: on any mismatch the index is
+        reloaded and the rows are looked up by ID again.
+        """
+        action_ids = list(dict.fromkeys(action_ids))
+        entries = self._pending_entries()
+        wanted = [entries[a] for a in action_ids if a in entries]
+        if wanted:
+            ranges = ws.batch_get([f"A{entry['row']}" for entry in wanted])
+            found = [str(r[0][0]) if r and r[0] else "" for r in ranges]
+            if all(value == entry["values"][0] for value, entry in zip(found, wanted)):
+                return wanted
+            print("SHEETS: PENDING_ACTIONS rows moved (compacted elsewhere), reloading the index.")
+        entries = self._pending_entries(force=True)
+        return [entries[a] for a in action_ids if a in entries]
+
+    def delete_pending_actions(self, action_ids: list[str]) -> int:
+        """Delete several PENDING_ACTIONS rows with one batch request. Returns rows deleted."""
         if not self.client:
-             self.connect()
+            self.connect()
         try:
-            ws = self.doc.worksheet("PENDING_ACTIONS")
-            cell = ws.find(action_id)
-            if not cell:
-                return None
+            with self._pending_lock:
+                entries = self._pending_entries()
+                rows = sorted({entries[a]["row"] for a in action_ids if a in entries})
+                if not rows:
+                    return 0
+                ws = self.doc.worksheet("PENDING_ACTIONS")
+                # Bottom-up, so each request's row numbers are still valid when it runs
+                requests = [
+                    {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": row - 1, "endIndex": row}}}
+                    for row in reversed(rows)
+                ]
+                try:
+                    self.doc.batch_update({"requests": requests})
+                except Exception:
+                    self._pending_index = None # the sheet may or may not have changed, reload
+                    raise
+                for action_id in action_ids:
+                    entries.pop(action_id, None)
+                # Following rows moved up by the number of deleted rows above them
+                for entry in entries.values():
+                    entry["row"] -= bisect.bisect_left(rows, entry["row"])
+                return len(rows)
+        except Exception as e:
+            print(f"SHEETS ERROR: Could not delete pending actions. {e}")
+            raise e
             
-            row_values = ws.row_values(cell.row)
+    def get_pending_action(self, action_id: str) -> dict:
+        return self.get_pending_actions_by_id([action_id]).get(action_id)
+
+    def get_pending_actions_by_id(self, action_ids: list[str]) -> dict:
+        """
+        id -> action for the ids found. Ids missing from the index (e.g. queued by another
+        worker since the last read) trigger one forced reload before being reported missing.
+        """
+        try:
+            with self._pending_lock:
+                entries = self._pending_entries()
+                if any(a not in entries for a in action_ids):
+                    entries = self._pending_entries(force=True)
+                found = {a: entries[a] for a in action_ids if a in entries}
+        except Exception as e:
+             print(f"SHEETS ERROR: Could not get pending action. {e}")
+             return {}
+
+        actions = {}
+        for action_id, entry in found.items():
+            row_values = entry["values"]
             if len(row_values) < 5:
-                return None
+                continue
                 
-            return {
+            actions[action_id] = {
                 "ID": row_values[0],
                 "TIMESTAMP": row_values[1],
                 "REQUESTER_EMAIL": row_values[2],
                 "ACTION_TYPE": row_values[3],
                 "PAYLOAD_JSON": row_values[4],
-                "STATUS": row_values[5] if len(row_values) > 5 else "PENDING"
+                "PAYLOAD": copy.deepcopy(entry["payload"]), # already parsed PAYLOAD_JSON (None if invalid)
+                "STATUS": row_values[5] if len(row_values) > 5 and row_values[5] else "PENDING"
             }
-        except Exception as e:
-             print(f"SHEETS ERROR: Could not get pending action. {e}")
-             return None
+        return actions
 
     
-    def get_inventory(self) -> list[dict]:
-        """Fetch all records from INVENTARIO tab, robustly finding headers."""
+    # --- INVENTORY REPLICA ---
+
+    def _store_inventory_values(self, values: list[list[str]]):
+        """Replace the replica content, bumping the version only if it changed."""
+        with self._inventory_lock:
+            if values != self._inventory_values:
+                self._inventory_values = values
+                self._inventory_version += 1
+            self._inventory_fetched_at = time.time()
+
+    def _get_inventory_values(self, force: bool = False) -> list[list[str]]:
+        """Raw INVENTARIO values from the replica, re-downloaded once the TTL expires."""
+        with self._inventory_lock:
+            expired = (time.time() - self._inventory_fetched_at) > self.INVENTORY_CACHE_TTL
+            if self._inventory_values is not None and not expired and not force:
+                return self._inventory_values
+
+        # Download outside the lock: readers keep being served from the replica meanwhile
         if not self.client:
-             self.connect()
+            self.connect()
         try:
             ws = self.doc.worksheet("INVENTARIO")
-            all_values = ws.get_all_values()
-            
+            values = ws.get_all_values()
+        except Exception as e:
+            print(f"SHEETS ERROR: Could not refresh inventory replica. {e}")
+            return self._inventory_values if self._inventory_values is not None else []
+
+        self._store_inventory_values(values)
+        self.save_snapshot()
+        return values
+
+    def get_inventory_view(self) -> tuple[int, list[list[str]], list[dict]]:
+        """
+        Return (version, raw values, records) from one consistent replica state.
+        The replica lists are replaced, never mutated, so callers may hold on to them
+        (e.g. a batch request reusing one snapshot for all its lines).
+        """
+        self._get_inventory_values()
+        return self.peek_inventory_view()
+
+    def peek_inventory_view(self) -> tuple[int, list[list[str]], list[dict]]:
+        """Like get_inventory_view() but from whatever the replica holds now, never hitting Sheets."""
+        with self._inventory_lock:
+            values = self._inventory_values or []
+            version = self._inventory_version
+            if self._inventory_records_version != version:
+                self._inventory_records = self._parse_inventory_values(values)
+                self._inventory_records_version = version
+            return version, values, self._inventory_records
+
+    def get_inventory_snapshot(self) -> tuple[int, list[dict]]:
+        """Return (version, records) consistently, so callers can cache per version."""
+        version, _, records = self.get_inventory_view()
+        return version, records
+
+    @property
+    def inventory_version(self) -> int:
+        return self._inventory_version
+
+    def get_inventory(self) -> list[dict]:
+        """Fetch all records from INVENTARIO tab (served from the in-memory replica)."""
+        _, records = self.get_inventory_snapshot()
+        return list(records)
+
+    def _inventory_schema(self, values: list[list[str]]):
+        """Column layout of INVENTARIO, detected once and reused while the header row is unchanged."""
+        schema = self._inventory_schema_cache
+        if schema is not None and schema.matches(values):
+            return schema
+        schema = detect_inventory_schema(values)
+        if schema is not None:
+            print(f"SHEETS: INVENTARIO layout {schema.layout} (header row {schema.header_row + 1}).")
+            self._inventory_schema_cache = schema
+        return schema
+
+    def _parse_inventory_values(self, all_values: list[list[str]]) -> list[dict]:
+        """Parse raw INVENTARIO values into records using the cached schema."""
+        try:
             if not all_values:
                 return []
 
-            # 1. Find Header Row
-            header_row_index = -1
-            headers = []
-            
-            for i, row in enumerate(all_values):
-                # Normalize row values to check for known headers
-                normalized_row = [str(c).strip().upper() for c in row]
-                valid_headers = ["ID_UBICACION", "ID_LUGAR", "ID_REGISTRO", "LUGAR", "UBICACION"]
-                if any(h in normalized_row for h in valid_headers):
-                    header_row_index = i
-                    # Capture headers with original casing but stripped
-                    headers = [str(c).strip() for c in row] 
-                    break
-            
-            if header_row_index == -1:
+            schema = self._inventory_schema(all_values)
+            if schema is None:
                 print("SHEETS ERROR: Could not find 'ID_UBICACION', 'ID_LUGAR', or 'ID_REGISTRO' header in INVENTARIO tab.")
                 return []
 
-            # 2. Parse Rows
-            results = []
-            for row in all_values[header_row_index + 1:]:
-                # skip empty rows
-                if not any(row): continue
-                
-                item = {}
-                for idx, header in enumerate(headers):
-                    if idx < len(row) and header: # Only map if header exists
-                        # Map LUGAR variants to ID_UBICACION for compatibility if needed
-                         key = header
-                         upper_h = header.upper()
-                         if upper_h in ["ID_LUGAR", "LUGAR", "UBICACION"]:
-                             key = "ID_UBICACION"
-                         
-                         item[key] = row[idx]
-                         
-                         # Keep original too just in case
-                         if upper_h in ["ID_LUGAR", "LUGAR", "UBICACION"]:
-                             item["ID_LUGAR"] = row[idx]
-                         if upper_h in ["ID_REGISTRO", "REGISTRO"]:
-                             item["ID_REGISTRO"] = row[idx]
-
-                results.append(item)
-                
-            print(f"SHEETS: Fetched {len(results)} items from INVENTARIO.")
+            # skip empty rows
+            results = [schema.to_record(row) for row in all_values[schema.data_start:] if any(row)]
+            print(f"SHEETS: Parsed {len(results)} items from INVENTARIO (v{self._inventory_version}).")
             return results
 
         except Exception as e:
             print(f"SHEETS ERROR: Could not get inventory. {e}")
             return []
 
-    def get_available_locations(self, limit: int = 3) -> list[str]:
-        """Find meaningful available locations (empty shelves or pallets)."""
+    def get_available_locations(self, limit: int = 3, values: list[list[str]] = None) -> list[str]:
+        """Find meaningful available locations (empty shelves or pallets), optionally from a given snapshot."""
         if not self.client: 
             self.connect()
             
         try:
             # 1. Get all occupied locations
-            ws_inv = self.doc.worksheet("INVENTARIO")
-            all_vals = ws_inv.get_all_values()
+            all_vals = values if values is not None else self._get_inventory_values()
             
             occupied = set()
-            if all_vals:
-                headers = [str(h).strip().upper() for h in all_vals[0]]
-                try:
-                    idx = -1
-                    if "ID_UBICACION" in headers: idx = headers.index("ID_UBICACION")
-                    elif "ID_LUGAR" in headers: idx = headers.index("ID_LUGAR")
-                    
-                    if idx != -1:
-                        for row in all_vals[1:]:
-                            if len(row) > idx and row[idx].strip():
-                                occupied.add(row[idx].strip().upper())
-                except:
-                   pass
+            schema = self._inventory_schema(all_vals) if all_vals else None
+            if schema:
+                for row in all_vals[schema.data_start:]:
+                    # Rows emptied by SALIDA/MOVIMIENTO (qty 0) no longer occupy the slot
+                    if schema.quantity(row) == 0:
+                        continue
+                    loc = schema.location_key(row)
+                    if loc:
+                        occupied.add(loc)
 
             # 2. Compare with Valid Locations
             # Prioritize Shelves (E*) over Pallets (Numbers)
@@ -515,6 +782,287 @@ class SheetService:
             print(f"SHEETS ERROR: Could not calculate availability. {e}")
             return []
 
+    def get_layout(self, force: bool = False) -> dict:
+        """Map layout state stored as JSON in Config!B1 (cached until the next write or refresh)."""
+        if self._layout_json is None or force:
+            if not self.client:
+                self.connect()
+            try:
+                ws_config = self.doc.worksheet("Config")
+                self._layout_json = ws_config.acell('B1').value or ""
+                self.save_snapshot()
+            except Exception as e:
+                print(f"SHEETS ERROR: Could not fetch layout. {e}")
+                if self._layout_json is None:
+                    return {}
+        try:
+            return json.loads(self._layout_json) if self._layout_json else {}
+        except ValueError:
+            print("SHEETS ERROR: Config JSON is not valid.")
+            return {}
+
+    def peek_users(self):
+        """Last known USUARIOS records (e.g. from the warm-start snapshot) without hitting Sheets."""
+        if self._users_records is None:
+            return None
+        return [dict(r) for r in self._users_records]
+
+    # --- WARM START SNAPSHOT ---
+
+    def save_snapshot(self):
+        """
+        Persist INVENTARIO, USUARIOS (without passwords) and the Config layout to local disk,
+        atomically and only when the content changed since the last save.
+        """
+        path = settings.SNAPSHOT_PATH
+        if not path:
+            return
+        data = {
+            "inventory": self._inventory_values,
+            "users": self._snapshot_users(self._users_records),
+            "layout": self._layout_json,
+        }
+        try:
+            body = orjson.dumps(data)
+            digest = hashlib.sha256(body).digest()
+            with self._snapshot_lock:
+                if digest == self._snapshot_digest:
+                    return
+                directory = os.path.dirname(os.path.abspath(path))
+                # Unique temp file per writer (workers share the path), then an atomic rename
+                with tempfile.NamedTemporaryFile("wb", dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False) as f:
+                    f.write(SNAPSHOT_MAGIC)
+                    # {"saved_at": ..., "data": <body>} without serializing the data twice
+                    f.write(b'{"saved_at":' + orjson.dumps(time.time()) + b',"data":' + body + b'}')
+                try:
+                    os.replace(f.name, path)
+                except OSError:
+                    os.unlink(f.name)
+                    raise
+                self._snapshot_digest = digest
+        except Exception as e:
+            print(f"SHEETS WARNING: Could not write snapshot to {path}. {e}")
+
+    @staticmethod
+    def _snapshot_users(users):
+        """USUARIOS records without the PASSWORD column: hashes (or plaintext) never go to disk."""
+        if users is None:
+            return None
+        return [{k: v for k, v in u.items() if str(k).strip().upper() != "PASSWORD"} for u in users]
+
+    def load_snapshot(self) -> bool:
+        """Load the on-disk snapshot (memory-mapped) into the caches, marked as stale."""
+        path = settings.SNAPSHOT_PATH
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                try:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    buf = f.read() # empty file or no mmap support
+                try:
+                    if buf[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                        print(f"SHEETS WARNING: Ignoring snapshot with unknown format: {path}")
+                        return False
+                    with memoryview(buf) as view:
+                        document = orjson.loads(view[len(SNAPSHOT_MAGIC):])
+                finally:
+                    if isinstance(buf, mmap.mmap):
+                        buf.close()
+        except Exception as e:
+            print(f"SHEETS WARNING: Could not load snapshot from {path}. {e}")
+            return False
+
+        data = document.get("data") or {}
+        self._snapshot_digest = hashlib.sha256(orjson.dumps(data)).digest() # same content: no rewrite
+        if data.get("inventory") is not None:
+            self._store_inventory_values(data["inventory"])
+        if data.get("users") is not None:
+            self._users_records = data["users"]
+        if data.get("layout") is not None:
+            self._layout_json = data["layout"]
+        self.snapshot_stale = True
+
+        age = time.time() - document.get("saved_at", 0)
+        print(f"SHEETS: Warm start from snapshot ({age:.0f}s old). Serving stale data until reconciled.")
+        return True
+
+    def reconcile(self) -> bool:
+        """Re-download everything held in the snapshot and clear the stale flag. False if Sheets failed."""
+        fetched_at = self._inventory_fetched_at
+        self._get_inventory_values(force=True)
+        if self._inventory_fetched_at == fetched_at:
+            print("SHEETS WARNING: Reconcile failed, still serving the snapshot.")
+            return False
+        users = self._users_records
+        self.get_users()
+        if self._users_records is users: # get_users() only replaces the list on success
+            print("SHEETS WARNING: Reconcile could not fetch users, still serving the snapshot.")
+            return False
+        self.get_layout(force=True)
+        self.snapshot_stale = False
+        print("SHEETS: Snapshot reconciled with Google Sheets.")
+        return True
+
+    def _reconcile_until_done(self):
+        """reconcile() with exponential backoff until it succeeds, so a failed first try isn't final."""
+        delay = 5
+        while not self.reconcile():
+            time.sleep(delay)
+            delay = min(delay * 2, settings.SNAPSHOT_RECONCILE_MAX_BACKOFF_SECONDS)
+
+    def warm_start(self):
+        """Serve from the local snapshot right away and reconcile with Sheets in the background."""
+        if self.load_snapshot():
+            threading.Thread(target=self._reconcile_until_done, name="sheets-reconcile", daemon=True).start()
+
+    # --- MAINTENANCE ---
+
+    def compact_inventory(self, dry_run: bool = False) -> dict:
+        """
+        Merge duplicate INVENTARIO rows and drop zero-quantity rows, rewriting the tab in one batch.
+        Rows are duplicates when location, material, lote and estado all match (quantities are summed
+        into the first occurrence); rows whose quantity is not a number are kept untouched.
+        The tab is re-read right before the rewrite: if another process changed it since the plan
+        was made, compaction starts over rather than overwriting that change.
+        """
+        if not self.client:
+            self.connect()
+
+        with self._inventory_write_lock:
+            ws = self.doc.worksheet("INVENTARIO")
+            all_values = ws.get_all_values()
+            for attempt in range(3):
+                schema, compacted, report = self._plan_compaction(all_values)
+                report["dry_run"] = dry_run
+                if dry_run or report["rows_reclaimed"] == 0:
+                    return report
+                fresh = ws.get_all_values()
+                if fresh == all_values:
+                    break
+                print(f"SHEETS: INVENTARIO changed while compacting, re-planning (attempt {attempt + 1}).")
+                all_values = fresh
+            else:
+                raise Exception("INVENTARIO kept changing during compaction, nothing was written.")
+            header_row_index = schema.header_row
+
+            # One write of the compacted rows, then the now-unused tail rows are deleted
+            # (blanking them would leave rows that every later run counts and rewrites again)
+            width = max([len(schema.headers)] + [len(r) for r in all_values])
+            padded = [r + [""] * (width - len(r)) for r in compacted]
+            ws.update(range_name=f"A{header_row_index + 2}", values=padded)
+            tail_start = header_row_index + 1 + len(compacted) # 0-based sheet row after the data
+            if len(all_values) > tail_start:
+                self.doc.batch_update({"requests": [{"deleteDimension": {"range": {
+                    "sheetId": ws.id, "dimension": "ROWS", "startIndex": tail_start, "endIndex": len(all_values)
+                }}}]})
+
+            self._store_inventory_values(all_values[:header_row_index + 1] + compacted)
+            self.save_snapshot()
+
+        print(f"SHEETS: Compacted INVENTARIO. {report['rows_reclaimed']} rows / {report['bytes_reclaimed']} bytes reclaimed.")
+        return report
+
+    def _plan_compaction(self, all_values: list[list[str]]) -> tuple:
+        """(schema, compacted rows, report) of compact_inventory() for one INVENTARIO read."""
+        schema = self._inventory_schema(all_values)
+        if schema is None:
+            raise Exception("Could not find INVENTARIO headers, refusing to compact.")
+        if schema.idx_material == -1 or schema.idx_qty == -1:
+            raise Exception(f"INVENTARIO headers mismatch, refusing to compact. Found headers: {schema.headers}")
+        idx_mat, idx_qty = schema.idx_material, schema.idx_qty
+
+        data_rows = all_values[schema.header_row + 1:]
+        while data_rows and not any(str(c).strip() for c in data_rows[-1]):
+            data_rows.pop() # trailing blank rows are not data (and are deleted below anyway)
+        kept = []
+        merged_into = {} # key -> index in kept
+        duplicates_merged = 0
+        zero_rows_removed = 0
+
+        for row in data_rows:
+            if not any(str(c).strip() for c in row):
+                continue # blank rows are reclaimed too
+            qty = schema.quantity(row)
+            if qty is None:
+                kept.append(list(row))
+                continue
+
+            key = (
+                schema.location_key(row),
+                schema.cell(row, "MATERIAL").lower(),
+                schema.cell(row, "LOTE"),
+                schema.cell(row, "ESTADO").upper(),
+            )
+            if key in merged_into:
+                target = kept[merged_into[key]]
+                target[idx_qty] = str(int(target[idx_qty]) + qty)
+                duplicates_merged += 1
+                continue
+
+            new_row = list(row)
+            while len(new_row) <= max(idx_mat, idx_qty):
+                new_row.append("")
+            new_row[idx_qty] = str(qty)
+            merged_into[key] = len(kept)
+            kept.append(new_row)
+
+        # Zero rows are dropped after merging so a +N/-N pair across duplicates disappears as well
+        compacted = []
+        for row in kept:
+            if str(row[idx_qty]).strip() == "0":
+                zero_rows_removed += 1
+                continue
+            compacted.append(row)
+
+        def size(rows):
+            return sum(len(str(c).encode("utf-8")) for r in rows for c in r)
+
+        report = {
+            "rows_before": len(data_rows),
+            "rows_after": len(compacted),
+            "rows_reclaimed": len(data_rows) - len(compacted),
+            "duplicates_merged": duplicates_merged,
+            "zero_rows_removed": zero_rows_removed,
+            "bytes_before": size(data_rows),
+            "bytes_after": size(compacted),
+        }
+        report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+        return schema, compacted, report
+
+    def compact_pending_actions(self) -> dict:
+        """
+        Move processed (APPROVED / REJECTED) PENDING_ACTIONS rows to PENDING_ARCHIVE: one append
+        to the archive and one batched row delete, so the queue tab only holds open requests.
+        """
+        if not self.client:
+            self.connect()
+
+        with self._pending_lock:
+            entries = self._pending_entries(force=True)
+            processed = [(action_id, entry) for action_id, entry in entries.items() if self._pending_processed(entry)]
+            if not processed:
+                return {"archived": 0, "pending": len(entries)}
+
+            try:
+                ws_archive = self.doc.worksheet("PENDING_ARCHIVE")
+            except gspread.exceptions.WorksheetNotFound:
+                ws_archive = self.doc.add_worksheet(title="PENDING_ARCHIVE", rows=1000, cols=len(self._pending_headers) + 1)
+                ws_archive.append_row(self._pending_headers + ["ARCHIVED_AT"])
+
+            archived_at = datetime.datetime.utcnow().isoformat()
+            width = len(self._pending_headers)
+            ws_archive.append_rows([
+                entry["values"][:width] + [""] * (width - len(entry["values"])) + [archived_at]
+                for _, entry in processed
+            ])
+            self.delete_pending_actions([action_id for action_id, _ in processed])
+
+        report = {"archived": len(processed), "pending": len(entries)}
+        print(f"SHEETS: PENDING_ACTIONS compacted. {report}")
+        return report
+
     def create_backup(self) -> str:
         """Crea una copia de seguridad nativa completa del Google Sheet en Google Drive."""
         if not self.client:
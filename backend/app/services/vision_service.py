@@ -8,8 +8,8 @@ settings = get_settings()
 
 class VisionService:
     def __init__(self):
+        # Created on first use, in the worker: gRPC channels must not be shared across fork
         self.client = None
-        self._init_client()
 
     def _init_client(self):
         try:
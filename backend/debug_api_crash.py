@@ -8,6 +8,8 @@ from app.services.nlp_service import nlp_service
 from app.services.sheets_service import sheet_service
 from app.models.schemas import Interpretation
 
+nlp_service.load_model() # the app loads it in background at startup
+
 # Mocking the logic in api/assistant.py
 def simulate_assistant_flow(text_to_process, user_query):
     print(f"--- Simulating Flow for: '{text_to_process}' ---")
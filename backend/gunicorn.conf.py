@@ -0,0 +1,22 @@
+# Gunicorn settings for production: gunicorn -c gunicorn.conf.py
+# With several workers the app is preloaded in the master (spaCy model, static data) and
+# the workers share those pages copy-on-write instead of each loading its own copy.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# A single worker gains nothing from preloading and would give up the background model
+# load (the port only opens once the model is in memory), so it defaults to preload with 2+.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1" if workers > 1 else "0") == "1"
+wsgi_app = f"app.main:create_app(preload_models={preload_app})"
+
+def pre_fork(server, worker):
+    # Everything allocated in the master so far goes to the permanent generation
+    gc.freeze()
+
+def post_fork(server, worker):
+    server.log.info(f"Worker spawned (pid: {worker.pid}, preload: {preload_app})")
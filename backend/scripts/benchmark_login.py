@@ -0,0 +1,175 @@
+"""
+Benchmark password login under concurrency: throughput, latency and event-loop stalls.
+
+In-process (default): USUARIOS is replaced by synthetic users hashed with BCRYPT_ROUNDS, then
+--requests logins run with --concurrency in flight, in two modes:
+
+- inline: authenticate_user() called from the coroutine (bcrypt runs on the event loop, as /login did)
+- pool:   authenticate_user_async() (bcrypt on the AUTH_HASH_WORKERS threads)
+
+A ticker coroutine measures how late the event loop wakes up: "max_loop_lag_ms" is what every
+other request on the worker waits while a login hashes. Each cost runs in its own subprocess
+because the bcrypt cost is read from the settings at import.
+
+Against a running server (--url), POSTs /api/v1/auth/login with a real account instead.
+
+Usage (from backend/):
+    python scripts/benchmark_login.py
+    python scripts/benchmark_login.py --rounds 10 12 --workers 1 2 4 --concurrency 16
+    python scripts/benchmark_login.py --url http://127.0.0.1:8000 --email a@b.com --password secret
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+N_USERS = 8
+PASSWORD = "benchmark-password"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summary(latencies_ms, elapsed_s, failures):
+    return {
+        "logins_per_s": round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else None,
+        "mean_ms": round(statistics.mean(latencies_ms), 1) if latencies_ms else None,
+        "p95_ms": percentile([round(l, 1) for l in latencies_ms], 95),
+        "failures": failures,
+    }
+
+async def run_logins(login, n_requests, concurrency):
+    """Run n_requests logins, concurrency at a time, while a ticker measures event-loop lag."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures, lags = [], 0, []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append((time.perf_counter() - start) * 1000 - 5)
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            user = await login(f"user{i % N_USERS}@bench.local", PASSWORD)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not user:
+                failures += 1
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    result = summary(latencies, elapsed, failures)
+    result["max_loop_lag_ms"] = round(max(lags), 1) if lags else None
+    return result
+
+def run_in_process(n_requests, concurrency):
+    from app.core.config import get_settings
+    from app.services.auth_service import auth_service, pwd_context
+    from app.services.sheets_service import sheet_service
+
+    settings = get_settings()
+    users = [{"USER_ID": f"user{i}@bench.local", "ROLE": "USER", "NAME": f"User {i}", "PASSWORD": pwd_context.hash(PASSWORD)}
+             for i in range(N_USERS)]
+    sheet_service.get_users = lambda: [dict(u) for u in users]
+    sheet_service.peek_users = lambda: None
+    auth_service.refresh_users()
+
+    async def inline(email, password):
+        return auth_service.authenticate_user(email, password)
+
+    results = []
+    for mode, login in (("inline", inline), ("pool", auth_service.authenticate_user_async)):
+        result = asyncio.run(run_logins(login, n_requests, concurrency))
+        result.update({"mode": mode, "rounds": settings.BCRYPT_ROUNDS,
+                       "hash_workers": settings.AUTH_HASH_WORKERS if mode == "pool" else "-"})
+        results.append(result)
+    return results
+
+def run_against_server(url, email, password, n_requests, concurrency):
+    body = json.dumps({"email": email, "password": password}).encode()
+
+    def one(_):
+        request = urllib.request.Request(f"{url.rstrip('/')}/api/v1/auth/login", data=body,
+                                         headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as r:
+                ok = r.status == 200
+        except OSError:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n_requests)))
+    result = summary([l for l, _ in outcomes], time.perf_counter() - start, sum(1 for _, ok in outcomes if not ok))
+    result.update({"mode": "server", "concurrency": concurrency})
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="*", default=[12], help="bcrypt costs to compare")
+    parser.add_argument("--workers", type=int, nargs="*", default=[2], help="AUTH_HASH_WORKERS values to compare")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print("RESULT " + json.dumps(run_in_process(args.requests, args.concurrency)))
+        return
+
+    if args.url:
+        if not args.email or not args.password:
+            parser.error("--url needs --email and --password")
+        results = [run_against_server(args.url, args.email, args.password, args.requests, args.concurrency)]
+    else:
+        results = []
+        for rounds in args.rounds:
+            for workers in args.workers:
+                print(f"⏳ rounds={rounds} hash_workers={workers} ...", flush=True)
+                env = dict(os.environ, BCRYPT_ROUNDS=str(rounds), AUTH_HASH_WORKERS=str(workers))
+                cmd = [sys.executable, __file__, "--worker", "--requests", str(args.requests),
+                       "--concurrency", str(args.concurrency)]
+                proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+                lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+                if not lines:
+                    results.append({"mode": "-", "rounds": rounds, "hash_workers": workers,
+                                    "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]})
+                    continue
+                results.extend(json.loads(lines[-1][len("RESULT "):]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ["mode", "rounds", "hash_workers", "logins_per_s", "mean_ms", "p95_ms", "max_loop_lag_ms", "failures"]
+    print("\n" + " | ".join(columns))
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']} | {r['rounds']} | {r['hash_workers']} | ❌ {r['error']}")
+        else:
+            print(" | ".join(str(r.get(c, "-")) for c in columns))
+
+if __name__ == "__main__":
+    main()
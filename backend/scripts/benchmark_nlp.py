@@ -0,0 +1,225 @@
+"""
+Benchmark NLPService: throughput, latency and understanding, regex-only vs spaCy configurations.
+
+Each configuration runs in its own subprocess so RSS is measured in isolation.
+Reports on scripts/nlp_corpus.jsonl (ENTRADA / SALIDA / MOVIMIENTO / QUERY commands, labelled):
+parses per second, mean / p95 latency, intent accuracy and entity accuracy (material, quantity,
+locations), movements accuracy on the labelled compound commands, plus model RSS and load time. The parse cache is disabled so every round really parses.
+
+Usage (from backend/):
+    python scripts/benchmark_nlp.py
+    python scripts/benchmark_nlp.py --configs regex es_core_news_sm:parser,ner --repeat 5
+    python scripts/benchmark_nlp.py --configs regex --min-intent-acc 0.7   # exit 1 below threshold
+    python scripts/benchmark_nlp.py --configs regex --min-movements-acc 1
+
+A configuration is "regex" (no model) or MODEL:EXCLUDE, EXCLUDE being a comma separated list of
+components ("-" = none). By default the material gazetteer stays empty, so materials come from the
+noun heuristic alone. --gold-gazetteer seeds it with the corpus' own material labels (what a
+complete inventory would give): those material/movements numbers read the answers from the labels
+and are reported under a "+gold-gazetteer" config name.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import unicodedata
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'nlp_corpus.jsonl')
+DEFAULT_CONFIGS = [
+    "regex",                      # model not installed / still loading
+    "es_core_news_lg:-",          # previous behaviour: full pipeline
+    "es_core_news_lg:parser,ner", # default now
+    "es_core_news_md:parser,ner",
+    "es_core_news_sm:parser,ner",
+]
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def normalize(s):
+    text = str(s or "").lower().strip()
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def movement_locations(interpretation):
+    return {loc for m in interpretation.movements for loc in (m.origin, m.destination)}
+
+def same_movements(movements, expected, check_items=True):
+    """Compound commands: one movement per expected one, in order, same qty / origin / destination (and item)."""
+    from app.services.material_gazetteer import material_key
+    if len(movements) != len(expected):
+        return False
+    return all(
+        m.qty == e["qty"] and m.origin == e["origin"] and m.destination == e["destination"]
+        and (not check_items or material_key(m.item) == material_key(e["item"]))
+        for m, e in zip(movements, expected)
+    )
+
+def run_config(model, exclude, repeat, gazetteer=False):
+    from app.services.nlp_service import NLPService
+    from app.services.material_gazetteer import material_key
+
+    corpus = load_corpus()
+    config = "regex" if model is None else f"{model}:{','.join(exclude) or '-'}"
+    if gazetteer:
+        config += "+gold-gazetteer" # label leakage: the gazetteer knows every expected material
+    rss_start = rss_mb()
+    service = NLPService()
+    service.cache.max_entries = 0 # measure parsing, not the cache
+    if model is None:
+        service.ready = True
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.load_model(model, exclude)
+        if service.nlp is None:
+            return {"config": config, "error": "model not installed"}
+    rss_loaded = rss_mb()
+    if gazetteer:
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.sync_materials(1, [{"MATERIAL": e["material"]} for e in corpus if e.get("material")])
+
+    counts = {"intent": 0, "material": 0, "material_total": 0, "qty": 0, "qty_total": 0, "locations": 0, "locations_total": 0,
+              "movements": 0, "movements_total": 0}
+    # Without a model or gazetteer every item is the generic "material": compare items only when they can be known
+    check_items = gazetteer or model is not None
+    errors = []
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()): # parse() logs every analysis
+        bench_start = time.perf_counter()
+        for round_no in range(repeat):
+            for example in corpus:
+                start = time.perf_counter()
+                interpretation = service.parse(example["text"], "benchmark")
+                latencies.append((time.perf_counter() - start) * 1000)
+
+                if round_no:
+                    continue
+                ok = interpretation.intent == example["intent"]
+                counts["intent"] += ok
+                if not ok:
+                    errors.append(f"intent {interpretation.intent} != {example['intent']}: {example['text']}")
+                first = interpretation.movements[0] if interpretation.movements else None
+                if example.get("material"):
+                    counts["material_total"] += 1
+                    counts["material"] += bool(first) and material_key(first.item) == material_key(example["material"])
+                if example.get("qty") is not None:
+                    counts["qty_total"] += 1
+                    counts["qty"] += bool(first) and first.qty == example["qty"]
+                if example.get("locations") and example["intent"] != "QUERY":
+                    counts["locations_total"] += 1
+                    counts["locations"] += set(example["locations"]) <= movement_locations(interpretation)
+                if example.get("movements"):
+                    counts["movements_total"] += 1
+                    ok = same_movements(interpretation.movements, example["movements"], check_items)
+                    counts["movements"] += ok
+                    if not ok:
+                        got = [(m.item, m.qty, m.origin, m.destination) for m in interpretation.movements]
+                        errors.append(f"movements {got}: {example['text']}")
+        elapsed = time.perf_counter() - bench_start
+
+    ratio = lambda ok, total: round(counts[ok] / counts[total], 3) if counts[total] else None
+    return {
+        "config": config,
+        "gazetteer": gazetteer,
+        "pipeline": service.nlp.pipe_names if service.nlp else [],
+        "load_s": service.load_seconds,
+        "examples": len(corpus),
+        "parses_per_s": round(len(latencies) / elapsed, 1),
+        "intent_acc": round(counts["intent"] / len(corpus), 3),
+        "material_acc": ratio("material", "material_total"),
+        "qty_acc": ratio("qty", "qty_total"),
+        "location_acc": ratio("locations", "locations_total"),
+        "movements_acc": ratio("movements", "movements_total"),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "rss_model_mb": round(rss_loaded - rss_start, 1),
+        "rss_total_mb": round(rss_mb(), 1),
+        "errors": errors[:20],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="*", default=DEFAULT_CONFIGS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--gold-gazetteer", action="store_true",
+                        help="seed the gazetteer with the corpus material labels (leaks the expected answers)")
+    parser.add_argument("--min-intent-acc", type=float, help="exit 1 if a configuration scores below this")
+    parser.add_argument("--min-movements-acc", type=float, help="same, for compound commands (movements_acc)")
+    parser.add_argument("--show-errors", action="store_true", help="print misclassified / misparsed commands")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        if args.worker == "regex":
+            model, exclude = None, []
+        else:
+            model, _, exclude = args.worker.partition(":")
+            exclude = [] if exclude in ("", "-") else exclude.split(",")
+        print("RESULT " + json.dumps(run_config(model, exclude, args.repeat, args.gold_gazetteer)))
+        return
+
+    results = []
+    for config in args.configs:
+        print(f"⏳ {config} ...", flush=True)
+        cmd = [sys.executable, __file__, "--worker", config, "--repeat", str(args.repeat)]
+        if args.gold_gazetteer:
+            cmd.append("--gold-gazetteer")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+        if not lines:
+            results.append({"config": config, "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]})
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        columns = ["config", "parses_per_s", "mean_ms", "p95_ms", "intent_acc", "material_acc", "qty_acc",
+                   "location_acc", "movements_acc", "rss_model_mb", "load_s"]
+        print("\n" + " | ".join(columns))
+        for r in results:
+            if "error" in r:
+                print(f"{r['config']} | ❌ {r['error']}")
+            else:
+                print(" | ".join(str(r.get(c)) for c in columns))
+        if args.show_errors:
+            for r in results:
+                for e in r.get("errors", []):
+                    print(f"  [{r['config']}] {e}")
+
+    if args.min_intent_acc is not None:
+        failed = [r["config"] for r in results if "error" not in r and r["intent_acc"] < args.min_intent_acc]
+        if failed:
+            print(f"❌ intent accuracy below {args.min_intent_acc}: {', '.join(failed)}")
+            sys.exit(1)
+    if args.min_movements_acc is not None:
+        failed = [r["config"] for r in results if "error" not in r and (r["movements_acc"] or 0) < args.min_movements_acc]
+        if failed:
+            print(f"❌ movements accuracy below {args.min_movements_acc}: {', '.join(failed)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Regression checks for InventorySchema (no Sheets access needed): location keys of V2 rows built
+by new_row() must identify the slot they were written to, so transactions, occupancy and
+compaction never mix two locations.
+
+Usage (from backend/):
+    python scripts/check_inventory_schema.py   # exit 1 on the first failing case
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.inventory_schema import InventorySchema
+from app.static_data import SCHEMA_V2
+
+def check(label, got, expected):
+    if got != expected:
+        print(f"❌ {label}: {got!r} != {expected!r}")
+        sys.exit(1)
+    print(f"✅ {label}: {got!r}")
+
+def main():
+    schema = InventorySchema(0, list(SCHEMA_V2.values()))
+    key = lambda location: schema.location_key(schema.new_row(location, "Sillas", 1))
+
+    # A whole-shelf row and the pallet with the same number are different slots
+    check("shelf without module", key("E1"), "E1")
+    check("pallet with the shelf's number", key("1"), "1")
+    check("prefixed pallet", key("P-1"), "P-1")
+    check("shelf module", key("E1-M2"), "E1-M2")
+    check("shelf module and height", key("E1-M2-A3"), "E1-M2-A3")
+
+    # Rows typed by hand: TIPO_UBICACION alone marks a shelf, ID_REGISTRO 'E1' too
+    row = [""] * len(schema.headers)
+    row[schema.columns["TIPO_UBICACION"]] = "Estantería"
+    row[schema.columns["ID_LUGAR"]] = "4"
+    check("shelf by TIPO_UBICACION", schema.location_key(row), "E4")
+    row[schema.columns["TIPO_UBICACION"]] = ""
+    row[schema.columns["ID_REGISTRO"]] = "e4"
+    check("shelf by ID_REGISTRO", schema.location_key(row), "E4")
+    row[schema.columns["ID_REGISTRO"]] = "4"
+    check("untyped bare number is a pallet", schema.location_key(row), "4")
+
+if __name__ == "__main__":
+    main()
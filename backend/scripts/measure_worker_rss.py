@@ -0,0 +1,122 @@
+"""
+Measure per-worker memory of the Gunicorn deployment, with and without preload_app.
+
+For each worker count a server is started with gunicorn.conf.py ("preload": model loaded
+once in the master; "fork": GUNICORN_PRELOAD=0, each worker loads its own), the script waits
+for the NLP model to be ready on /health, then reads /proc/<pid>/smaps_rollup of every worker:
+
+- RSS: resident pages, shared ones counted in full in every worker
+- PSS: shared pages split between the processes sharing them (sum = real footprint)
+- USS: pages private to the worker (what each extra worker really costs)
+
+Usage (from backend/, Linux only):
+    python scripts/measure_worker_rss.py
+    python scripts/measure_worker_rss.py --workers 1 2 4 8 --modes preload fork
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def smaps(pid):
+    """kB values of /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return values
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+def wait_ready(port, timeout):
+    """Poll /health until a worker reports the NLP model as ready."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as r:
+                if json.loads(r.read()).get("nlp", {}).get("ready"):
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+def measure(n_workers, preload, timeout):
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(n_workers), PORT=str(port), GUNICORN_PRELOAD="1" if preload else "0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        start = time.time()
+        if not wait_ready(port, timeout):
+            return {"workers": n_workers, "mode": "preload" if preload else "fork", "error": "not ready in time"}
+        ready_s = time.time() - start
+        # /health only tells about the worker that answered: give the others the same time to finish
+        # loading (without preload each one loads its own model, preloaded workers are ready at once)
+        time.sleep(ready_s + 2)
+
+        worker_pids = children(proc.pid)
+        per_worker = [smaps(pid) for pid in worker_pids]
+        master = smaps(proc.pid)
+        mb = lambda kb: round(kb / 1024, 1)
+        uss = [w.get("Private_Clean", 0) + w.get("Private_Dirty", 0) for w in per_worker]
+        return {
+            "workers": n_workers,
+            "mode": "preload" if preload else "fork",
+            "ready_s": round(ready_s, 1),
+            "rss_per_worker_mb": mb(sum(w["Rss"] for w in per_worker) / len(per_worker)),
+            "pss_per_worker_mb": mb(sum(w["Pss"] for w in per_worker) / len(per_worker)),
+            "uss_per_worker_mb": mb(sum(uss) / len(uss)),
+            "total_pss_mb": mb(sum(w["Pss"] for w in per_worker) + master["Pss"]),
+        }
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--modes", nargs="*", default=["preload", "fork"], choices=["preload", "fork"])
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the model to load")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        for n in args.workers:
+            print(f"⏳ {mode} x{n} ...", flush=True)
+            results.append(measure(n, mode == "preload", args.timeout))
+
+    columns = ["mode", "workers", "ready_s", "rss_per_worker_mb", "pss_per_worker_mb", "uss_per_worker_mb", "total_pss_mb"]
+    print("\n" + " | ".join(columns))
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']} | {r['workers']} | ❌ {r['error']}")
+        else:
+            print(" | ".join(str(r.get(c)) for c in columns))
+
+if __name__ == "__main__":
+    main()